@@ -1,20 +1,33 @@
 import aiohttp
 import asyncio
+import logging
 from dotenv import load_dotenv
 import os
 
 load_dotenv()
 api_key = os.getenv('FINNHUB_API_KEY')
-
-async def search_finnhub(query):
-    url = f"https://finnhub.io/api/v1/search?q={query}&token={api_key}"
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as resp:
-            if resp.status != 200:
-                print(f"Error: {resp.status}")
-                return None
-            data = await resp.json()
-            return data
+base_url = os.getenv('FINNHUB_BASE_URL', "https://finnhub.io")
+logger = logging.getLogger('reqvest_providers')
+
+async def search_finnhub(query, session=None):
+    if session is None:
+        async with aiohttp.ClientSession() as session:
+            return await search_finnhub(query, session)
+
+    url = f"{base_url}/api/v1/search"
+    async with session.get(url, params={"q": query, "token": api_key}) as resp:
+        if resp.status != 200:
+            logger.warning("Finnhub search failed: HTTP %s", resp.status)
+            return None
+        data = await resp.json()
+        return data
+
+def parse_finnhub(data):
+    return [
+        (item.get("symbol", ""), item.get("description", ""))
+        for item in data.get("result", [])
+        if item.get("type") == "Common Stock"
+    ]
 
 async def main():
     print("Finnhub Stock Search Tester")
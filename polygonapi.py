@@ -1,36 +1,137 @@
-import requests
-import time
+import aiohttp
+import asyncio
 import json
-from dotenv import load_dotenv
 import os
+import time
+from dotenv import load_dotenv
 
 load_dotenv()
 API_KEY = os.getenv('POLYGON_API_KEY')
 
-base_url = "https://api.polygon.io/v3/reference/tickers"
+base_url = os.getenv('POLYGON_BASE_URL', "https://api.polygon.io") + "/v3/reference/tickers"
 limit = 1000
 
-tickers = []
-url = f"{base_url}?limit={limit}&active=true&apiKey={API_KEY}"
+OUTPUT_PATH = "tickers.json"
+PAGES_PATH = "tickers.jsonl"
+CHECKPOINT_PATH = "tickers.checkpoint.json"
+
+
+class TokenBucket:
+    """Paces requests to `rate` per second, backing off on 429s and creeping back up on success."""
+
+    def __init__(self, rate, capacity, min_rate=None):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate or rate / 16
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+            wait = self.blocked_until - now
+            if wait <= 0 and self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep(max(wait, (1 - self.tokens) / self.rate))
+
+    def throttled(self, retry_after=None):
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.tokens = 0
+        self.blocked_until = time.monotonic() + (retry_after if retry_after is not None else 1 / self.rate)
+
+    def succeeded(self):
+        self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+
+
+def load_checkpoint():
+    if not os.path.exists(CHECKPOINT_PATH):
+        return None
+    with open(CHECKPOINT_PATH, "r") as f:
+        return json.load(f)
+
+
+def save_checkpoint(next_url, pages):
+    tmp_path = f"{CHECKPOINT_PATH}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"next_url": next_url, "pages": pages}, f)
+    os.replace(tmp_path, CHECKPOINT_PATH)
+
+
+async def fetch_page(session, bucket, url):
+    while True:
+        await bucket.acquire()
+        async with session.get(url) as response:
+            if response.status == 429:
+                retry_after = response.headers.get("Retry-After")
+                bucket.throttled(float(retry_after) if retry_after else None)
+                print(f"Rate limit hit. Slowing to {bucket.rate * 60:.1f} requests/minute...")
+                continue
+            response.raise_for_status()
+            bucket.succeeded()
+            return await response.json()
+
+
+async def fetch_tickers(rate_per_minute=5):
+    """Streams every ticker page to PAGES_PATH, checkpointing the cursor after each page."""
+    checkpoint = load_checkpoint()
+    if checkpoint:
+        url, pages = checkpoint["next_url"], checkpoint["pages"]
+        print(f"Resuming after {pages} pages")
+    else:
+        url, pages = f"{base_url}?limit={limit}&active=true", 0
+        open(PAGES_PATH, "w").close()
+
+    bucket = TokenBucket(rate_per_minute / 60, capacity=rate_per_minute)
+    headers = {"Authorization": f"Bearer {API_KEY}"}
+
+    async with aiohttp.ClientSession(headers=headers) as session:
+        with open(PAGES_PATH, "a") as out:
+            while url:
+                print(f"Fetching page {pages + 1}")
+                data = await fetch_page(session, bucket, url)
+
+                for ticker in data.get("results", []):
+                    out.write(json.dumps(ticker) + "\n")
+                out.flush()
+                os.fsync(out.fileno())
+
+                pages += 1
+                url = data.get("next_url")
+                save_checkpoint(url, pages)
 
-while url:
-    print(f"Fetching: {url}")
-    response = requests.get(url)
-    if response.status_code == 429:
-        print("Rate limit hit. Waiting 60 seconds...")
-        time.sleep(60)
-        continue
 
-    data = response.json()
-    tickers.extend(data.get("results", []))
-    url = data.get("next_url")
+def write_tickers():
+    # A crash between writing a page and saving its cursor replays that page on resume.
+    seen = set()
+    count = 0
+    tmp_path = f"{OUTPUT_PATH}.tmp"
+    with open(PAGES_PATH, "r") as pages, open(tmp_path, "w") as out:
+        out.write("[")
+        for line in pages:
+            ticker = json.loads(line)
+            key = (ticker.get("ticker"), ticker.get("market"))
+            if key in seen:
+                continue
+            seen.add(key)
+            out.write(("," if count else "") + json.dumps(ticker))
+            count += 1
+        out.write("]")
+    os.replace(tmp_path, OUTPUT_PATH)
 
-    if url:
-        url += f"&apiKey={API_KEY}"
+    os.remove(CHECKPOINT_PATH)
+    os.remove(PAGES_PATH)
+    return count
 
-    time.sleep(12)
 
-print(f"Total tickers fetched: {len(tickers)}")
+async def main():
+    await fetch_tickers(float(os.getenv("POLYGON_RATE_PER_MINUTE", "5")))
+    print(f"Total tickers fetched: {write_tickers()}")
 
-with open("tickers.json", "w") as f:
-    json.dump(tickers, f, indent=2)
+if __name__ == "__main__":
+    asyncio.run(main())
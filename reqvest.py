@@ -3,36 +3,60 @@ from discord import app_commands
 from discord.ext import commands
 from dotenv import load_dotenv
 import os
+import asyncio
 import logging
-import json
-from rapidfuzz import process, fuzz
 import re
-from collections import defaultdict
 from discord.ui import View, Select
 from datetime import datetime, time, timedelta
 import pytz
+from reqvestindex import POPULAR_TIER, CompanyIndex, PrefixIndex, TieredIndex
+from reqvestcompact import CompactCompanyIndex
+from reqvestresolver import Resolver, normalize_request
+from reqvestsessions import SessionStore
+from reqvestlogging import setup_logging, start_listener
+from reqvestshards import parse_shard_ids
+from reqvestmetrics import (
+    COMMAND_ERRORS, COMMAND_SECONDS, REGISTRY, SamplingProfiler, monitor_loop_lag, start_server, timed
+)
 
 TORONTO_TZ = pytz.timezone('America/Toronto')
 PACIFIC_TZ = pytz.timezone("America/Los_Angeles")
 
+COUNT_PAGE_SIZE = 25
+
+TICKERS_PATH = "tickers.json"
+POPULARITY_PATH = "tickers_cleaned.json"
+
 load_dotenv()
 token = os.getenv('DISCORD_TOKEN')
 
-logging.basicConfig(
-    level=logging.DEBUG, 
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# The listener thread starts once the resolver's worker processes are forked.
+log_listener = setup_logging(start=False)
 logger = logging.getLogger('reqvest_bot')
 
-class MyBot(commands.Bot):
+class MyBot(commands.AutoShardedBot):
     def __init__(self):
         intents = discord.Intents.default()
         intents.message_content = True
         intents.members = True
 
-        super().__init__(command_prefix="!", intents=intents)
+        # Without SHARD_COUNT Discord's recommended count is used; SHARD_IDS pins this
+        # process to a subset of the shards so several processes can split the gateway.
+        shard_count = int(os.getenv("SHARD_COUNT", "0")) or None
+        shard_ids = parse_shard_ids(os.getenv("SHARD_IDS", ""))
+
+        super().__init__(
+            command_prefix="!",
+            intents=intents,
+            shard_count=shard_count,
+            shard_ids=shard_ids,
+            # Nothing reads guild member lists, so don't download them for every guild on connect.
+            chunk_guilds_at_startup=False
+        )
 
         self.db = None
+        self.metrics_runner = None
+        self.profiler = None
 
     async def setup_hook(self):
         from reqvestdb import Database
@@ -41,54 +65,153 @@ class MyBot(commands.Bot):
         database=os.getenv("DB_NAME")
         user=os.getenv("DB_USER")
         password=os.getenv("DB_PASSWORD")
-
-        self.db = Database(host, database, user, password)
-        self.db.create_tables()
-        await self.tree.sync()
+        min_size=int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+        max_size=int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+        cycles_per_partition=int(os.getenv("CYCLES_PER_PARTITION", "64"))
+
+        self.db = Database(host, database, user, password, min_size, max_size, cycles_per_partition)
+        await self.db.connect()
+        await self.db.migrate()
+
+        retention_days = float(os.getenv("CYCLE_RETENTION_DAYS", "0"))
+        if retention_days > 0:
+            dropped = await self.db.drop_closed_partitions(datetime.now(pytz.utc) - timedelta(days=retention_days))
+            if dropped:
+                logger.info("Dropped %d partitions of closed request cycles", dropped)
+        # A process pinned to some shards only ever sees events for those shards' guilds.
+        await self.db.load_voters(self.shard_ids, self.shard_count)
+
+        if os.getenv("VOTE_WRITE_BEHIND", "").lower() in ("1", "true", "yes"):
+            from reqvestqueue import VoteQueue
+
+            journal = os.getenv("VOTE_JOURNAL", "vote_journal.jsonl")
+            if self.shard_ids is not None:
+                # Each shard process needs a journal of its own.
+                root, ext = os.path.splitext(journal)
+                journal = f"{root}.shard{self.shard_ids[0]}{ext}"
+
+            self.db = VoteQueue(
+                self.db,
+                journal,
+                float(os.getenv("VOTE_FLUSH_INTERVAL", "2"))
+            )
+            await self.db.start()
+
+        # Commands are global, so only the process owning shard 0 syncs them.
+        if self.shard_ids is None or 0 in self.shard_ids:
+            await self.tree.sync()
+
+        provider_names = [name.strip() for name in os.getenv("SYMBOL_PROVIDERS", "").split(",") if name.strip()]
+        if provider_names:
+            from reqvestproviders import ProviderCache, SymbolProviders
+
+            provider_ttls = {
+                name: float(ttl)
+                for name, ttl in (
+                    item.split("=") for item in os.getenv("PROVIDER_CACHE_TTLS", "").split(",") if "=" in item
+                )
+            }
+            provider_cache = ProviderCache(
+                os.getenv("PROVIDER_CACHE_PATH", "provider_cache.sqlite3"),
+                ttls=provider_ttls,
+                default_ttl=float(os.getenv("PROVIDER_CACHE_TTL", str(7 * 86400))),
+                negative_ttl=float(os.getenv("PROVIDER_NEGATIVE_TTL", "86400")),
+                max_entries=int(os.getenv("PROVIDER_CACHE_SIZE", "50000"))
+            )
+            resolver.providers = SymbolProviders(
+                provider_names,
+                timeout=float(os.getenv("PROVIDER_TIMEOUT", "2")),
+                hedge_delay=float(os.getenv("PROVIDER_HEDGE_DELAY", "0.3")),
+                cache=provider_cache
+            )
+            await resolver.providers.start()
+
+        watch_interval = float(os.getenv("UNIVERSE_WATCH_INTERVAL", "0"))
+        if watch_interval > 0:
+            self.universe_watcher = asyncio.create_task(watch_universe(watch_interval))
+
+        metrics_port = int(os.getenv("METRICS_PORT", "0"))
+        if metrics_port:
+            if os.getenv("METRICS_PROFILE", "").lower() in ("1", "true", "yes"):
+                self.profiler = SamplingProfiler(interval=float(os.getenv("METRICS_PROFILE_INTERVAL", "0.01")))
+                self.profiler.start()
+            if self.shard_ids is not None:
+                # Shard processes on one host each listen on their own port.
+                metrics_port += self.shard_ids[0]
+            self.metrics_runner = await start_server(
+                os.getenv("METRICS_HOST", "127.0.0.1"), metrics_port, self.profiler
+            )
+            self.loop_monitor = asyncio.create_task(monitor_loop_lag())
+            logger.info("Serving metrics on port %d", metrics_port)
+
+    async def close(self):
+        if self.metrics_runner:
+            await self.metrics_runner.cleanup()
+        if self.profiler:
+            self.profiler.stop()
+        resolver.close()
+        if resolver.providers:
+            await resolver.providers.close()
+        if self.db:
+            await self.db.close()
+        await super().close()
 
 bot = MyBot()
 
-user_states = {}
+sessions = SessionStore(
+    max_sessions=int(os.getenv("SESSION_LIMIT", "1000")),
+    idle_ttl=float(os.getenv("SESSION_IDLE_TTL", "600"))
+)
 
 class TickerSelect(Select):
-    def __init__(self, options, user_id, state):
+    def __init__(self, options, session):
         super().__init__(
             placeholder="Choose a ticker",
             min_values=1,
             max_values=1,
             options=[discord.SelectOption(label=o) for o in options]
         )
-        self.user_id = user_id
-        self.state = state
+        self.session = session
 
+    @timed(COMMAND_SECONDS, COMMAND_ERRORS, command="select")
     async def callback(self, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True)
 
+        session = self.session
+        if not sessions.is_current(session):
+            await interaction.followup.send(
+                "This selection has expired. Please use `/request` again.",
+                ephemeral=True
+            )
+            return
+        sessions.touch(session)
+
         selected = self.values[0]
-        self.state["confirmed"].append(selected)
-        del self.state["awaiting"][self.state["current_request"]]
+        session.confirmed.append(selected)
+        del session.awaiting[session.current_request]
 
         self.disabled = True
 
         await interaction.edit_original_response(view=self.view)
+        self.view.stop()
 
-        if self.state["awaiting"]:
-            self.state["current_request"] = next(iter(self.state["awaiting"]))
+        if session.awaiting:
+            session.current_request = next(iter(session.awaiting))
             await interaction.followup.send(
-                f"Multiple tickers found for {self.state['current_request']}:",
-                view=TickerView(self.user_id, self.state),
+                f"Multiple tickers found for {session.current_request}:",
+                view=TickerView(session),
                 ephemeral=True
             )
         else:
-            bot.db.add_member_requests(
+            await bot.db.add_member_requests(
                 interaction.guild_id,
-                self.user_id,
-                self.state["confirmed"],
+                session.user_id,
+                session.confirmed,
                 interaction.user.display_name
             )
 
             await interaction.followup.send(
-                f"Requests received: {', '.join(self.state['confirmed'])}",
+                f"Requests received: {', '.join(session.confirmed)}",
                 ephemeral=True
             )
 
@@ -96,54 +219,91 @@ class TickerSelect(Select):
                 f"{interaction.user.mention} submitted stock requests!"
             )
 
-            del user_states[self.user_id]
+            sessions.complete(session)
 
 
 class TickerView(View):
-    def __init__(self, user_id, state):
-        super().__init__(timeout=None)
-        self.select = TickerSelect(state["awaiting"][state["current_request"]], user_id, state)
+    def __init__(self, session):
+        super().__init__(timeout=sessions.idle_ttl)
+        self.session = session
+        session.view = self
+        self.select = TickerSelect(session.awaiting[session.current_request], session)
         self.add_item(self.select)
 
+    async def on_timeout(self):
+        sessions.expire(self.session)
+
+
+popular_size = int(os.getenv("RESOLVER_POPULAR_TIER", str(POPULAR_TIER)))
+if os.getenv("INDEX_COMPACT", "").lower() in ("1", "true", "yes"):
+    company_index = CompactCompanyIndex.from_file(TICKERS_PATH)
+else:
+    company_index = CompanyIndex.from_file(TICKERS_PATH)
+company_index = TieredIndex.from_file(company_index, POPULARITY_PATH, popular_size)
+popularity = company_index.ranks
+prefix_index = PrefixIndex(company_index, popularity)
+resolver = Resolver(
+    company_index,
+    TICKERS_PATH,
+    workers=int(os.getenv("RESOLVER_WORKERS", "0")),
+    mode=os.getenv("RESOLVER_MODE", "process"),
+    cache_size=int(os.getenv("RESOLVER_CACHE_SIZE", "10000")),
+    cache_ttl=float(os.getenv("RESOLVER_CACHE_TTL", "0")) or None,
+    popularity_path=POPULARITY_PATH,
+    popular_size=popular_size
+)
+start_listener(log_listener)
 
-def clean_company_name(name):
-    name = re.sub(r'[,\s]*\bNew\b\s*$', '', name, flags=re.IGNORECASE)
 
-    name = re.sub(
-        r'\b(Corporation|Corp\.?|Inc\.?|Incorporated|Ltd\.?|LLC|PLC|S\.A\.|L\.P\.|Group|Holdings?|'
-        r'Company|Co\.?|Class [A-Z]+|Series [A-Z0-9]+|Units?|Warrants?|ETF.*?|Depositary Shares.*?|'
-        r'Common Stock|Preferred Stock|Ordinary Shares|American Depositary Shares)\b',
-        '',
-        name,
-        flags=re.IGNORECASE
-    )
+REGISTRY.gauge(
+    "reqvest_resolver_cache", "Resolver memo cache size and hit/miss totals.", ("stat",),
+    collect=lambda: {(stat,): value for stat, value in resolver.cache.stats().items()}
+)
+REGISTRY.gauge(
+    "reqvest_sessions", "Disambiguation sessions: active count and lifetime totals.", ("stat",),
+    collect=lambda: {(stat,): value for stat, value in sessions.stats().items()}
+)
 
-    name = re.sub(r'[^A-Za-z0-9\s]', '', name)
+reload_lock = asyncio.Lock()
 
-    name = re.sub(r'\s+', ' ', name).strip()
 
-    return name.upper()
+def _build_reloaded_universe(index):
+    new_index, changes = index.reloaded(TICKERS_PATH)
+    if changes is None:
+        return None
+    return new_index, PrefixIndex(new_index, popularity), changes
 
 
-def build_company_data(filepath):
-    with open(filepath, "r") as f:
-        raw_data = json.load(f)
+async def reload_universe():
+    """Rebuilds the indexes off the event loop and swaps them in; returns the diff, or None."""
+    global company_index, prefix_index
 
-    company_map = defaultdict(list)
-    
-    for entry in raw_data:
-        if entry["market"] not in ["indices", "otc", "fx"]:
-            name = clean_company_name(entry["name"])
-            # name = entry["title"].strip().upper()
-            ticker = entry["ticker"].upper()
-            company_map[name].append(ticker)
+    async with reload_lock:
+        reloaded = await asyncio.to_thread(_build_reloaded_universe, company_index)
+        if reloaded is None:
+            return None
 
-    company_to_ticker = {name: sorted(tickers) for name, tickers in company_map.items()}
-    ticker_to_company = {ticker: name for name, tickers in company_to_ticker.items() for ticker in tickers}
+        company_index, prefix_index, changes = reloaded
+        await resolver.set_index(company_index)
+
+    logger.info(
+        "Ticker universe reloaded: %d added, %d removed, %d changed",
+        len(changes["added"]), len(changes["removed"]), len(changes["changed"])
+    )
+    return changes
 
-    return company_to_ticker, ticker_to_company
 
-company_to_ticker, ticker_to_company = build_company_data("tickers.json")
+async def watch_universe(interval):
+    last_modified = os.path.getmtime(TICKERS_PATH)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            modified = os.path.getmtime(TICKERS_PATH)
+            if modified != last_modified:
+                last_modified = modified
+                await reload_universe()
+        except Exception:
+            logger.exception("Ticker universe reload failed")
 
 
 """ @tasks.loop(minutes=1)
@@ -161,17 +321,18 @@ async def daily_reminder():
  
 @bot.event
 async def on_ready():
-    pass
+    logger.info("Ready on shards %s of %s with %d guilds", sorted(bot.shards), bot.shard_count, len(bot.guilds))
     # if not daily_reminder.is_running():
     #     daily_reminder.start()
 
 
 @bot.event
+@timed(COMMAND_SECONDS, COMMAND_ERRORS, command="on_message")
 async def on_message(message):
     if message.author.bot:
         return
 
-    if bot.db.has_user_voted(message.guild.id, message.author.id):
+    if await bot.db.has_user_voted(message.guild.id, message.author.id):
         return
     
     try:
@@ -191,51 +352,6 @@ async def on_message(message):
     await bot.process_commands(message) 
 
 
-""" def company_name_scorer(query, choice, **kwargs):
-    return (
-        0.5 * fuzz.partial_ratio(query, choice)
-        + 0.3 * fuzz.token_set_ratio(query, choice)
-        + 0.2 * fuzz.ratio(query, choice)
-    ) """
-
-def company_name_scorer(query, choice, **kwargs):
-    return (
-        0.35 * fuzz.partial_token_set_ratio(query, choice)
-        + 0.25 * fuzz.partial_ratio(query, choice)
-        + 0.2 * fuzz.token_sort_ratio(query, choice)
-        + 0.1 * fuzz.ratio(query, choice)
-        + 0.1 * fuzz.WRatio(query, choice)
-    )
-
-
-def process_requests(requests):
-    confirmed = []
-    awaiting = {}
-    no_matches = []
-
-    for request in requests:
-        if request in ticker_to_company:
-            confirmed.append(request)
-        elif request in company_to_ticker:
-            tickers = company_to_ticker[request]
-            if len(tickers) == 1:
-                confirmed.append(tickers[0])
-            else:
-                awaiting[request] = tickers
-        else:
-            match, score, _ = process.extractOne(request, company_to_ticker.keys(), scorer=company_name_scorer)
-            if score > 80:
-                tickers = company_to_ticker[match]
-                if len(tickers) == 1:
-                    confirmed.append(tickers[0])
-                else:
-                    awaiting[match] = tickers
-            else:
-                no_matches.append(request)
-
-    return confirmed, awaiting, no_matches
-
-
 def is_valid_request(text):
     text = text.strip()
     
@@ -244,6 +360,7 @@ def is_valid_request(text):
 
 @bot.tree.command(name="request", description="Request one or more stocks by name or ticker")
 @app_commands.describe(stocks="Enter any number of stock names or tickers, separated by commas (e.g. Apple, TSLA, Nvidia)")
+@timed(COMMAND_SECONDS, COMMAND_ERRORS, command="request")
 async def request(interaction: discord.Interaction, stocks: str):
     await interaction.response.defer(ephemeral=True)
 
@@ -258,13 +375,15 @@ async def request(interaction: discord.Interaction, stocks: str):
         return
 
     user_id = interaction.user.id
-    confirmed, awaiting, no_matches = process_requests(valid_requests)
+    confirmed, awaiting, no_matches = await resolver.resolve(valid_requests)
 
     messages = []
 
     if confirmed:
-        bot.db.add_member_requests(interaction.guild_id, user_id, confirmed, interaction.user.display_name)
+        _, duplicates = await bot.db.add_member_requests(interaction.guild_id, user_id, confirmed, interaction.user.display_name)
         messages.append(f"Requests received: {', '.join(confirmed)}")
+        if duplicates:
+            messages.append(f"Already counted from an earlier request: {', '.join(duplicates)}")
 
         if not awaiting:
             await interaction.channel.send(
@@ -276,15 +395,11 @@ async def request(interaction: discord.Interaction, stocks: str):
         messages.append("Please check spelling or try using the stock's ticker symbol.")
 
     if awaiting:
-        user_states[user_id] = {
-            "awaiting": awaiting,
-            "confirmed": confirmed,
-            "current_request": next(iter(awaiting))
-        }
+        session = sessions.start(user_id, awaiting, confirmed)
 
         await interaction.followup.send(
-            f"Multiple tickers found for {user_states[user_id]['current_request']}:",
-            view=TickerView(user_id, user_states[user_id]),
+            f"Multiple tickers found for {session.current_request}:",
+            view=TickerView(session),
             ephemeral=True
         )
     else:
@@ -293,15 +408,40 @@ async def request(interaction: discord.Interaction, stocks: str):
             ephemeral=True
         )
 
+
+@request.autocomplete("stocks")
+@timed(COMMAND_SECONDS, COMMAND_ERRORS, command="autocomplete")
+async def stocks_autocomplete(interaction: discord.Interaction, current: str):
+    # Discord replaces the whole field with the chosen value, so keep the entries already typed.
+    *entered, typing = current.split(",")
+    head = ", ".join(e.strip() for e in entered if e.strip())
+    head = f"{head}, " if head else ""
+
+    choices = []
+    for label, value in prefix_index.suggest(normalize_request(typing)):
+        value = head + value
+        if len(value) <= 100:
+            choices.append(app_commands.Choice(name=label, value=value))
+    return choices
+
         
 @bot.tree.command(name="count", description="Show the count of all ticker requests.")
-async def count(interaction: discord.Interaction):
-    tally = bot.db.requests_count(interaction.guild_id)
+@app_commands.describe(page=f"Page of results to show, {COUNT_PAGE_SIZE} tickers per page (default 1)")
+@timed(COMMAND_SECONDS, COMMAND_ERRORS, command="count")
+async def count(interaction: discord.Interaction, page: app_commands.Range[int, 1] = 1):
+    offset = (page - 1) * COUNT_PAGE_SIZE
+    # One extra row tells us whether there is a next page without counting every ticker.
+    tally = await bot.db.requests_count(interaction.guild_id, COUNT_PAGE_SIZE + 1, offset)
+    has_more = len(tally) > COUNT_PAGE_SIZE
+    tally = tally[:COUNT_PAGE_SIZE]
 
     if not tally:
         embed = discord.Embed(
             title="No Stock Requests Yet",
-            description="No stock requests have been made so far. Use `/request` to submit your picks!",
+            description=(
+                "No stock requests have been made so far. Use `/request` to submit your picks!"
+                if page == 1 else f"There are no requests on page {page}."
+            ),
             color=discord.Color.orange()
         )
         await interaction.response.send_message(embed=embed)
@@ -309,7 +449,7 @@ async def count(interaction: discord.Interaction):
 
     vote_lines = [
         f"{i+1:>2}. **{ticker}** — {count} vote{'s' if count != 1 else ''}"
-        for i, (ticker, count) in enumerate(tally)
+        for i, (ticker, count) in enumerate(tally, start=offset)
     ]
 
     embed = discord.Embed(
@@ -317,10 +457,44 @@ async def count(interaction: discord.Interaction):
         description="\n".join(vote_lines),
         color=discord.Color.teal()
     )
+    if has_more:
+        embed.set_footer(text=f"Page {page} — use /count page:{page + 1} for more.")
+    elif page > 1:
+        embed.set_footer(text=f"Page {page}")
 
     await interaction.response.send_message(embed=embed)
 
 
+@bot.tree.command(name="history", description="Show the most requested tickers over recent weeks.")
+@app_commands.describe(weeks="How many weeks back to look, counting every cycle reset since then (default 8)")
+@timed(COMMAND_SECONDS, COMMAND_ERRORS, command="history")
+async def history(interaction: discord.Interaction, weeks: app_commands.Range[int, 1, 104] = 8):
+    since = datetime.now(pytz.utc) - timedelta(weeks=weeks)
+    tally = await bot.db.requests_history(interaction.guild_id, since, COUNT_PAGE_SIZE)
+
+    if not tally:
+        embed = discord.Embed(
+            title="No Stock Requests Yet",
+            description=f"No stock requests have been made in the last {weeks} weeks.",
+            color=discord.Color.orange()
+        )
+        await interaction.response.send_message(embed=embed)
+        return
+
+    vote_lines = [
+        f"{i+1:>2}. **{ticker}** — {count} vote{'s' if count != 1 else ''} "
+        f"across {cycles} cycle{'s' if cycles != 1 else ''}"
+        for i, (ticker, count, cycles) in enumerate(tally)
+    ]
+
+    embed = discord.Embed(
+        title=f"Most Requested Tickers, Last {weeks} Weeks:",
+        description="\n".join(vote_lines),
+        color=discord.Color.teal()
+    )
+    await interaction.response.send_message(embed=embed)
+
+
 """ def get_upcoming_sunday_date():
     today = datetime.now()
     days_ahead = (6 - today.weekday()) % 7  # Sunday = 6
@@ -337,8 +511,9 @@ def get_upcoming_sunday_date():
 
 
 @bot.tree.command(name="reset", description="Reset all requests.")
+@timed(COMMAND_SECONDS, COMMAND_ERRORS, command="reset")
 async def reset(interaction: discord.Interaction):
-    bot.db.reset_all_data(interaction.guild_id)
+    await bot.db.reset_all_data(interaction.guild_id)
 
     upcoming_sunday = get_upcoming_sunday_date()
 
@@ -374,6 +549,23 @@ async def reset(interaction: discord.Interaction):
         pass
 
 
+@bot.tree.command(name="reload", description="Reload the ticker universe from disk.")
+@timed(COMMAND_SECONDS, COMMAND_ERRORS, command="reload")
+async def reload(interaction: discord.Interaction):
+    await interaction.response.defer(ephemeral=True)
+
+    changes = await reload_universe()
+    if changes is None:
+        await interaction.followup.send("Ticker universe is already up to date.", ephemeral=True)
+        return
+
+    await interaction.followup.send(
+        f"Ticker universe reloaded: {len(changes['added'])} added, "
+        f"{len(changes['removed'])} removed, {len(changes['changed'])} changed.",
+        ephemeral=True
+    )
+
+
 @bot.tree.command(name="help", description="Learn how to use the Request Bot.")
 async def help(interaction: discord.Interaction):
     embed = discord.Embed(
@@ -397,4 +589,6 @@ async def help(interaction: discord.Interaction):
 
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
-bot.run(token)
+if __name__ == "__main__":
+    # Logging is already routed through setup_logging's queue; don't let discord.py add its own handler.
+    bot.run(token, log_handler=None)
@@ -0,0 +1,263 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import rapidfuzz
+
+from reqvestcompact import CompactCompanyIndex, write_compact
+from reqvestindex import (
+    CONFIDENT_SCORE, CompanyIndex, TieredIndex, build_company_data, clean_company_name, company_name_scorer,
+    company_name_scores, source_digest
+)
+from reqvestresolver import exact_outcome, fuzzy_outcomes, normalize_request, process_requests
+
+# Micro-benchmarks for the ticker resolution pipeline over the ranked tickers_cleaned.json
+# universe and the bench_queries.json corpus. Every result is "lower is better", so a run
+# is compared against the stored baseline metric by metric. Record a baseline with
+# --update-baseline on the machine that will run the comparisons; timings from different
+# hardware are not comparable.
+
+UNIVERSE_PATH = "tickers_cleaned.json"
+POPULARITY_PATH = "tickers_cleaned.json"
+QUERIES_PATH = "bench_queries.json"
+BASELINE_PATH = "bench_baseline.json"
+TOLERANCE = 0.25
+MIN_SAMPLE = 0.002
+
+
+def polygon_universe(path, workdir):
+    """Returns a Polygon-shaped tickers file for `path`, converting the ranked symbol list if needed."""
+    with open(path, "r") as f:
+        entries = json.load(f)
+    if not entries or "ticker" in entries[0]:
+        return path
+
+    converted = os.path.join(workdir, "tickers.json")
+    with open(converted, "w") as f:
+        json.dump(
+            [{"ticker": entry["symbol"], "name": entry["name"], "market": "stocks"} for entry in entries], f
+        )
+    return converted
+
+
+def load_queries(path):
+    """Flattens the {kind: [query, ...]} corpus into normalized (kind, request) pairs."""
+    with open(path, "r") as f:
+        corpus = json.load(f)
+    return [(kind, normalize_request(query)) for kind, queries in corpus.items() for query in queries]
+
+
+def best_of(fn, repeats):
+    """Fastest per-call time over `repeats` samples, in seconds.
+
+    Each sample loops the call enough times to last MIN_SAMPLE, so microsecond paths are
+    not swamped by timer jitter; the minimum is the least noisy estimate.
+    """
+    started = time.perf_counter()
+    fn()
+    number = max(1, int(MIN_SAMPLE / max(time.perf_counter() - started, 1e-9)))
+
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        timings.append((time.perf_counter() - started) / number)
+    return min(timings)
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def resolution_path(index, request):
+    if request in index.ticker_to_company or request in index.company_to_ticker:
+        return "exact"
+    if request in index.aliases:
+        return "alias"
+    return "fuzzy" if fuzzy_outcomes(index, [request])[request][0] != "no_match" else "no_match"
+
+
+def query_latencies(index, queries, repeats, prefix=""):
+    """Per-query process_requests latency by resolution path and corpus kind, plus the batch.
+
+    One request per call, the way a single-ticker /request reaches process_requests.
+    """
+    results = {}
+    latencies = {}
+    by_kind = {}
+    for kind, request in queries:
+        latency = best_of(lambda: process_requests(index, [request]), repeats) * 1e3
+        latencies.setdefault(resolution_path(index, request), []).append(latency)
+        by_kind.setdefault(kind, []).append(latency)
+    for path, values in sorted(latencies.items()):
+        values.sort()
+        results[f"{prefix}query_{path}_p50_ms"] = percentile(values, 0.50)
+        results[f"{prefix}query_{path}_p95_ms"] = percentile(values, 0.95)
+    for kind, values in sorted(by_kind.items()):
+        results[f"{prefix}kind_{kind}_mean_ms"] = statistics.fmean(values)
+
+    # The whole corpus resolved one request at a time, then as a single batch.
+    requests = [request for _, request in queries]
+    results[f"{prefix}sequential_ms"] = best_of(
+        lambda: [process_requests(index, [request]) for request in requests], repeats
+    ) * 1e3
+    results[f"{prefix}batch_ms"] = best_of(lambda: process_requests(index, requests), repeats) * 1e3
+    return results, {path: len(values) for path, values in sorted(latencies.items())}
+
+
+def measure_memory(build):
+    """Peak and retained Python heap, in MB, while building and then holding an index."""
+    tracemalloc.start()
+    try:
+        index = build()
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del index
+    return peak / 2**20, retained / 2**20
+
+
+def run(universe, popularity, queries, repeats, workdir):
+    results = {}
+    company_to_ticker, ticker_to_company = build_company_data(universe)
+    with open(universe, "r") as f:
+        raw_names = [entry["name"] for entry in json.load(f)]
+
+    results["clean_company_name_us"] = best_of(
+        lambda: [clean_company_name(name) for name in raw_names], repeats
+    ) / len(raw_names) * 1e6
+    results["build_company_data_ms"] = best_of(lambda: build_company_data(universe), repeats) * 1e3
+    results["index_build_ms"] = best_of(lambda: CompanyIndex(company_to_ticker, ticker_to_company), repeats) * 1e3
+
+    index = CompanyIndex(company_to_ticker, ticker_to_company)
+    digest = source_digest(universe)
+    snapshot_path = os.path.join(workdir, "bench.snapshot")
+    compact_path = os.path.join(workdir, "bench.compact")
+    index.save_snapshot(snapshot_path, digest)
+    write_compact(index, compact_path, digest)
+    results["snapshot_load_ms"] = best_of(lambda: CompanyIndex.load_snapshot(snapshot_path, digest), repeats) * 1e3
+    results["compact_attach_ms"] = best_of(lambda: CompactCompanyIndex(compact_path), repeats) * 1e3
+
+    # Scorer cost per (query, choice) pair, over each fuzzy query's real candidate set.
+    pairs = [
+        (request, choice)
+        for _, request in queries
+        if exact_outcome(index, request) is None
+        for choice in index.candidates(request)
+    ]
+    pair_queries = [query for query, _ in pairs]
+    pair_choices = [choice for _, choice in pairs]
+    results["scorer_pair_us"] = best_of(
+        lambda: [company_name_scorer(query, choice) for query, choice in pairs], repeats
+    ) / len(pairs) * 1e6
+    results["scorer_vectorized_pair_us"] = best_of(
+        lambda: company_name_scores(pair_queries, pair_choices), repeats
+    ) / len(pairs) * 1e6
+
+    latencies, paths = query_latencies(index, queries, repeats)
+    results.update(latencies)
+
+    # The same queries through the popularity tiers the bot resolves with.
+    results["tiered_build_ms"] = best_of(lambda: TieredIndex.from_file(index, popularity), repeats) * 1e3
+    tiered = TieredIndex.from_file(index, popularity)
+    latencies, tiered_paths = query_latencies(tiered, queries, repeats, prefix="tiered_")
+    results.update(latencies)
+    fuzzy = [request for _, request in queries if exact_outcome(tiered, request) is None]
+    popular_scores = [score for _, score in tiered.popular.best_matches(fuzzy)]
+    results["tiered_tail_share"] = sum(score < CONFIDENT_SCORE for score in popular_scores) / max(len(fuzzy), 1)
+
+    peak, retained = measure_memory(lambda: CompanyIndex(*build_company_data(universe)))
+    results["index_peak_mb"] = peak
+    results["index_retained_mb"] = retained
+    _, retained = measure_memory(lambda: CompactCompanyIndex(compact_path))
+    results["compact_retained_mb"] = retained
+
+    meta = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "rapidfuzz": rapidfuzz.__version__,
+        "machine": platform.machine(),
+        "universe": os.path.basename(universe),
+        "names": len(company_to_ticker),
+        "tickers": len(ticker_to_company),
+        "queries": len(queries),
+        "paths": paths,
+        "tiered_paths": tiered_paths,
+        "popular_names": len(tiered.popular.names),
+        "scored_pairs": len(pairs),
+        "repeats": repeats,
+    }
+    return {"meta": meta, "results": {name: round(value, 4) for name, value in results.items()}}
+
+
+def compare(results, baseline, tolerance):
+    """Returns (metric, baseline, current) for every metric more than `tolerance` worse than baseline."""
+    regressions = []
+    for name, before in baseline.items():
+        after = results.get(name)
+        if after is not None and before > 0 and after > before * (1 + tolerance):
+            regressions.append((name, before, after))
+    return regressions
+
+
+def print_report(report, baseline=None):
+    print(
+        f"{report['meta']['names']} names, {report['meta']['tickers']} tickers, "
+        f"{report['meta']['queries']} queries {report['meta']['paths']}, "
+        f"tiered {report['meta']['tiered_paths']}"
+    )
+    print(f"{'metric':<28}{'current':>12}{'baseline':>12}{'change':>10}")
+    for name, value in report["results"].items():
+        before = (baseline or {}).get(name)
+        if before:
+            print(f"{name:<28}{value:>12}{before:>12}{value / before - 1:>+10.1%}")
+        else:
+            print(f"{name:<28}{value:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ticker resolution pipeline.")
+    parser.add_argument("--universe", default=UNIVERSE_PATH, help="tickers_cleaned.json or a Polygon tickers.json")
+    parser.add_argument("--popularity", default=POPULARITY_PATH, help="ranked symbol list for the tiered resolver")
+    parser.add_argument("--queries", default=QUERIES_PATH)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", help="write the results here as JSON")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="allowed slowdown before flagging, 0.25 = 25%%")
+    parser.add_argument("--update-baseline", action="store_true", help="store this run as the new baseline")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        report = run(
+            polygon_universe(args.universe, workdir), args.popularity, load_queries(args.queries), args.repeats, workdir
+        )
+
+    baseline = None
+    if not args.update_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)["results"]
+    print_report(report, baseline)
+
+    for path in filter(None, (args.output, args.baseline if args.update_baseline else None)):
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {path}")
+
+    if baseline is None:
+        return 0
+    regressions = compare(report["results"], baseline, args.tolerance)
+    for name, before, after in regressions:
+        print(f"Regression in {name}: {before} -> {after} ({after / before - 1:+.1%})")
+    print(f"{len(regressions)} regressions beyond {args.tolerance:.0%} of {args.baseline}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
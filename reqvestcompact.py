@@ -0,0 +1,272 @@
+import bisect
+import mmap
+import os
+import struct
+from array import array
+from collections.abc import Mapping, Sequence
+from reqvestindex import CompanyIndex, diff_universes, source_digest
+
+MAGIC = b"RQVIDX02"
+SECTIONS = (
+    "names", "name_offsets", "name_order", "gram_counts",
+    "tickers", "ticker_offsets", "ticker_owner",
+    "name_ticker_offsets", "name_tickers",
+    "grams", "gram_offsets", "gram_ids",
+    "short_grams", "short_gram_offsets", "short_gram_ids",
+)
+# Magic, SHA-256 hex digest of the source, then (offset, length) for every section.
+HEADER = struct.Struct(f"<8s64s{2 * len(SECTIONS)}Q")
+GRAM_WIDTH = 3
+SHORT_GRAM_WIDTH = 2
+
+
+def _string_table(strings):
+    blob = bytearray()
+    offsets = array("I", [0])
+    for string in strings:
+        blob += string.encode("utf-8")
+        offsets.append(len(blob))
+    return bytes(blob), offsets
+
+
+def _posting_table(postings, width, new_ids):
+    # Fixed-width grams only, so the gram table can be bisected by position.
+    grams = sorted(gram for gram in postings if len(gram.encode("utf-8")) == width)
+    offsets = array("I", [0])
+    ids = array("I")
+    for gram in grams:
+        ids.extend(sorted(new_ids[name_id] for name_id in postings[gram]))
+        offsets.append(len(ids))
+    return "".join(grams).encode("utf-8"), offsets, ids
+
+
+def write_compact(index, path, digest):
+    """Serializes a CompanyIndex into the flat, mmap-able layout read by CompactCompanyIndex.
+
+    Tombstoned names are dropped and ids renumbered, so the file is always dense.
+    """
+    live_ids = [name_id for name_id, name in enumerate(index.names) if name is not None]
+    new_ids = {old_id: new_id for new_id, old_id in enumerate(live_ids)}
+    names = [index.names[name_id] for name_id in live_ids]
+
+    names_blob, name_offsets = _string_table(names)
+    name_order = array("I", sorted(range(len(names)), key=names.__getitem__))
+    gram_counts = array("I", (index.gram_counts[name_id] for name_id in live_ids))
+
+    name_ids = {name: name_id for name_id, name in enumerate(names)}
+    tickers = sorted(index.ticker_to_company)
+    tickers_blob, ticker_offsets = _string_table(tickers)
+    ticker_owner = array("I", (name_ids[index.ticker_to_company[ticker]] for ticker in tickers))
+
+    ticker_ids = {ticker: ticker_id for ticker_id, ticker in enumerate(tickers)}
+    name_ticker_offsets = array("I", [0])
+    name_tickers = array("I")
+    for name in names:
+        name_tickers.extend(ticker_ids[ticker] for ticker in index.company_to_ticker[name])
+        name_ticker_offsets.append(len(name_tickers))
+
+    grams_blob, gram_offsets, gram_ids = _posting_table(index.postings, GRAM_WIDTH, new_ids)
+    short_grams_blob, short_gram_offsets, short_gram_ids = _posting_table(
+        index.short_postings, SHORT_GRAM_WIDTH, new_ids
+    )
+
+    sections = {
+        "names": names_blob, "name_offsets": name_offsets, "name_order": name_order,
+        "gram_counts": gram_counts, "tickers": tickers_blob, "ticker_offsets": ticker_offsets,
+        "ticker_owner": ticker_owner, "name_ticker_offsets": name_ticker_offsets,
+        "name_tickers": name_tickers, "grams": grams_blob, "gram_offsets": gram_offsets,
+        "gram_ids": gram_ids, "short_grams": short_grams_blob, "short_gram_offsets": short_gram_offsets,
+        "short_gram_ids": short_gram_ids,
+    }
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(b"\0" * HEADER.size)
+        layout = []
+        for name in SECTIONS:
+            data = bytes(sections[name])
+            # Keep every section 8-byte aligned so the integer arrays can be cast in place.
+            f.write(b"\0" * (-f.tell() % 8))
+            layout += [f.tell(), len(data)]
+            f.write(data)
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, digest.encode("ascii"), *layout))
+    os.replace(tmp_path, path)
+
+
+class _Strings(Sequence):
+    def __init__(self, blob, offsets):
+        self._blob = blob
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return self._blob[self._offsets[i]:self._offsets[i + 1]].tobytes().decode("utf-8")
+
+
+class _CompanyToTicker(Mapping):
+    def __init__(self, index):
+        self._index = index
+
+    def __getitem__(self, name):
+        name_id = self._index._find_name(name)
+        if name_id is None:
+            raise KeyError(name)
+        return self._index._tickers_of(name_id)
+
+    def __iter__(self):
+        return iter(self._index.names)
+
+    def __len__(self):
+        return len(self._index.names)
+
+
+class _TickerToCompany(Mapping):
+    def __init__(self, index):
+        self._index = index
+
+    def __getitem__(self, ticker):
+        ticker_id = self._index._find_ticker(ticker)
+        if ticker_id is None:
+            raise KeyError(ticker)
+        return self._index.names[self._index._ticker_owner[ticker_id]]
+
+    def __iter__(self):
+        return iter(self._index._tickers)
+
+    def __len__(self):
+        return len(self._index._tickers)
+
+
+class _Sorted(Sequence):
+    """Positions 0..length-1 viewed through `key`, for bisecting without 3.10's bisect key=."""
+
+    def __init__(self, length, key):
+        self._length = length
+        self._key = key
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, i):
+        return self._key(i)
+
+
+class _Postings:
+    def __init__(self, grams, offsets, ids, width=GRAM_WIDTH):
+        self._grams = grams
+        self._offsets = offsets
+        self._ids = ids
+        self._width = width
+        self._count = len(offsets) - 1
+        self._sorted = _Sorted(self._count, self._gram)
+
+    def _gram(self, i):
+        return self._grams[i * self._width:(i + 1) * self._width].tobytes()
+
+    def get(self, gram, default=()):
+        key = gram.encode("utf-8")
+        i = bisect.bisect_left(self._sorted, key)
+        if i == self._count or self._gram(i) != key:
+            return default
+        return self._ids[self._offsets[i]:self._offsets[i + 1]]
+
+
+class CompactCompanyIndex(CompanyIndex):
+    """CompanyIndex served straight from a read-only memory-mapped file.
+
+    Every string is stored once in a flat table and every mapping is an offset array, so
+    processes that attach to the same file share its pages instead of each holding their
+    own dicts, lists and string objects.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.path = path
+
+        magic, digest, *layout = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a compact company index")
+        self.digest = digest.decode("ascii")
+        self.tombstones = 0
+
+        view = memoryview(self._mmap)
+        sections = {
+            name: view[layout[2 * i]:layout[2 * i] + layout[2 * i + 1]]
+            for i, name in enumerate(SECTIONS)
+        }
+        ints = {
+            name: sections[name].cast("I")
+            for name in SECTIONS if name not in ("names", "tickers", "grams", "short_grams")
+        }
+
+        self.names = _Strings(sections["names"], ints["name_offsets"])
+        self.gram_counts = ints["gram_counts"]
+        self.postings = _Postings(sections["grams"], ints["gram_offsets"], ints["gram_ids"])
+        self.short_postings = _Postings(
+            sections["short_grams"], ints["short_gram_offsets"], ints["short_gram_ids"], SHORT_GRAM_WIDTH
+        )
+        self._name_order = ints["name_order"]
+        self._sorted_names = _Sorted(len(self._name_order), lambda i: self.names[self._name_order[i]])
+        self._tickers = _Strings(sections["tickers"], ints["ticker_offsets"])
+        self._ticker_owner = ints["ticker_owner"]
+        self._name_ticker_offsets = ints["name_ticker_offsets"]
+        self._name_tickers = ints["name_tickers"]
+
+        self.company_to_ticker = _CompanyToTicker(self)
+        self.ticker_to_company = _TickerToCompany(self)
+
+    @classmethod
+    def from_file(cls, filepath, compact_path=None, snapshot_path=None):
+        """Attaches to the compact file for filepath, writing it first if it is missing or stale."""
+        compact_path = compact_path or f"{filepath}.compact"
+        digest = source_digest(filepath)
+
+        try:
+            index = cls(compact_path)
+            if index.digest == digest:
+                return index
+        except (OSError, ValueError, struct.error):
+            pass
+
+        return cls.from_index(CompanyIndex.from_file(filepath, snapshot_path), compact_path)
+
+    @classmethod
+    def from_index(cls, index, compact_path):
+        write_compact(index, compact_path, index.digest)
+        return cls(compact_path)
+
+    def reloaded(self, filepath, snapshot_path=None):
+        # The mapped file is immutable, so a changed source is rebuilt and written out whole;
+        # processes still attached to the old file keep reading it until they re-attach.
+        if source_digest(filepath) == self.digest:
+            return self, None
+
+        index = CompanyIndex.from_file(filepath, snapshot_path)
+        changes = diff_universes(self.company_to_ticker, index.company_to_ticker)
+        return CompactCompanyIndex.from_index(index, self.path), changes
+
+    def save_snapshot(self, snapshot_path, digest):
+        raise TypeError("CompactCompanyIndex is persisted with write_compact, not pickled")
+
+    def _find_name(self, name):
+        order = self._name_order
+        i = bisect.bisect_left(self._sorted_names, name)
+        if i < len(order) and self.names[order[i]] == name:
+            return order[i]
+        return None
+
+    def _find_ticker(self, ticker):
+        i = bisect.bisect_left(self._tickers, ticker)
+        if i < len(self._tickers) and self._tickers[i] == ticker:
+            return i
+        return None
+
+    def _tickers_of(self, name_id):
+        start, end = self._name_ticker_offsets[name_id], self._name_ticker_offsets[name_id + 1]
+        return [self._tickers[ticker_id] for ticker_id in self._name_tickers[start:end]]
@@ -1,115 +1,295 @@
-import psycopg2
-from psycopg2 import sql, OperationalError, DatabaseError
+import asyncpg
+import logging
+from collections import defaultdict
+from reqvestmetrics import DB_ERRORS, DB_SECONDS, timed
+from reqvestmigrations import migrate
+from reqvestshards import shard_filter_sql
+
+logger = logging.getLogger('reqvest_db')
 
 class Database:
-    def __init__(self, host, database, user, password):
+    def __init__(self, host, database, user, password, min_size=2, max_size=10, cycles_per_partition=64):
         self.connection_params = {
             "host": host,
             "database": database,
             "user": user,
             "password": password
         }
+        self.pool_params = {
+            "min_size": min_size,
+            "max_size": max_size,
+            "max_inactive_connection_lifetime": 300,
+            "statement_cache_size": 100
+        }
+        self.pool = None
+        self.cycles_per_partition = cycles_per_partition
+        # guild_id -> open cycle id, and the first cycle id of every existing partition.
+        self.cycles = {}
+        self.partitions = set()
+        self.voters = defaultdict(set)
+
+    @timed(DB_SECONDS, DB_ERRORS, method="connect")
+    async def connect(self):
+        self.pool = await asyncpg.create_pool(**self.connection_params, **self.pool_params)
+        await self.ping()
+
+    @timed(DB_SECONDS, DB_ERRORS, method="ping")
+    async def ping(self):
+        # Fails fast if the pool cannot reach the server; asyncpg drops broken connections on release.
+        return await self.pool.fetchval("SELECT 1") == 1
+
+    @timed(DB_SECONDS, DB_ERRORS, method="migrate")
+    async def migrate(self):
+        return await migrate(self)
+
+    async def _ensure_partition(self, conn, cycle_id):
+        start = cycle_id - cycle_id % self.cycles_per_partition
+        if start in self.partitions:
+            return
+
+        # Serializes partition creation across every process sharing the database.
+        await conn.execute("SELECT pg_advisory_xact_lock(hashtext('reqvest_partitions'))")
+        end = start + self.cycles_per_partition
+        for table in ("requests", "members_requests"):
+            await conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table}_{start} PARTITION OF {table} "
+                f"FOR VALUES FROM ({start}) TO ({end})"
+            )
+        self.partitions.add(start)
+
+    async def _partitions(self, conn):
+        names = await conn.fetch("""
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'requests'::regclass
+        """)
+        return sorted(int(name.rsplit("_", 1)[1]) for name, in names)
+
+    async def _open_cycle(self, guild_id):
+        """Returns the guild's open cycle id, opening a new cycle if it has none."""
+        cycle_id = self.cycles.get(guild_id)
+        if cycle_id is not None:
+            return cycle_id
+
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                cycle_id = None
+                while cycle_id is None:
+                    cycle_id = await conn.fetchval("""
+                        INSERT INTO cycles (guild_id) VALUES ($1)
+                        ON CONFLICT (guild_id) WHERE closed_at IS NULL DO NOTHING
+                        RETURNING cycle_id
+                    """, guild_id)
+                    if cycle_id is None:
+                        # None again if a reset closed the conflicting cycle in between.
+                        cycle_id = await conn.fetchval(
+                            "SELECT cycle_id FROM cycles WHERE guild_id = $1 AND closed_at IS NULL", guild_id
+                        )
+                await self._ensure_partition(conn, cycle_id)
+
+        self.cycles[guild_id] = cycle_id
+        return cycle_id
+
+    @timed(DB_SECONDS, DB_ERRORS, method="load_voters")
+    async def load_voters(self, shard_ids=None, shard_count=None):
+        # Warms the open cycles and their voter sets so has_user_voted never touches the
+        # database. Given shard_ids, only guilds routed to those shards are loaded.
+        shard_filter = "" if shard_ids is None or not shard_count else f"AND {shard_filter_sql('c.guild_id', '$1', '$2')}"
+        args = () if not shard_filter else (shard_count, shard_ids)
+
+        cycles = await self.pool.fetch(
+            f"SELECT c.guild_id, c.cycle_id FROM cycles c WHERE c.closed_at IS NULL {shard_filter}", *args
+        )
+        rows = await self.pool.fetch(f"""
+            SELECT DISTINCT c.guild_id, mr.discord_id
+            FROM cycles c
+            JOIN members_requests mr ON mr.cycle_id = c.cycle_id
+            WHERE c.closed_at IS NULL {shard_filter}
+        """, *args)
+        partitions = await self._partitions(self.pool)
+
+        self.cycles = dict(cycles)
+        self.partitions = set(partitions)
+        self.voters.clear()
+        for guild_id, discord_id in rows:
+            self.voters[guild_id].add(discord_id)
 
-    def _get_connection(self):
-        return psycopg2.connect(**self.connection_params)
-
-    def create_tables(self):
-        with self._get_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute('''
-                    CREATE TABLE IF NOT EXISTS members (
-                        guild_id BIGINT,
-                        discord_id BIGINT,
-                        member_name TEXT NOT NULL,
-                        PRIMARY KEY (guild_id, discord_id)
-                    )
-                ''')
-                cur.execute('''
-                    CREATE TABLE IF NOT EXISTS requests (
-                        guild_id BIGINT,
-                        ticker TEXT,
-                        PRIMARY KEY (guild_id, ticker)
-                    )
-                ''')
-                cur.execute('''
-                    CREATE TABLE IF NOT EXISTS members_requests (
-                        guild_id BIGINT,
-                        discord_id BIGINT,
-                        ticker TEXT,
-                        PRIMARY KEY (guild_id, discord_id, ticker),
-                        FOREIGN KEY (guild_id, discord_id) REFERENCES members(guild_id, discord_id) ON DELETE CASCADE,
-                        FOREIGN KEY (guild_id, ticker) REFERENCES requests(guild_id, ticker) ON DELETE CASCADE
-                    )
-                ''')
-
-    def _add_member(self, conn, guild_id, discord_id, member_name):
-        with conn.cursor() as cur:
-            cur.execute("""
-                INSERT INTO members (guild_id, discord_id, member_name)
-                VALUES (%s, %s, %s)
-                ON CONFLICT DO NOTHING
-            """, (guild_id, discord_id, member_name))
-
-    def _add_requests(self, conn, guild_id, tickers):
-        with conn.cursor() as cur:
-            for ticker in tickers:
-                cur.execute("""
-                    INSERT INTO requests (guild_id, ticker)
-                    VALUES (%s, %s)
-                    ON CONFLICT DO NOTHING
-                """, (guild_id, ticker.upper()))
-
-    def _link_member_to_requests(self, conn, guild_id, discord_id, tickers):
-        with conn.cursor() as cur:
-            for ticker in tickers:
-                cur.execute("""
-                    INSERT INTO members_requests (guild_id, discord_id, ticker)
-                    VALUES (%s, %s, %s)
-                    ON CONFLICT DO NOTHING
-                """, (guild_id, discord_id, ticker.upper()))
-
-    def add_member_requests(self, guild_id, discord_id, tickers, member_name):
+    async def _insert_votes(self, votes):
+        # votes: (guild_id, discord_id, member_name, tickers) tuples with upper-cased tickers.
+        # Links only the tickers each member has not voted for yet, then upserts the tally
+        # for exactly those. Foreign keys are checked once the statement ends, after the
+        # member and request rows from the sibling inserts exist.
+        members = {(guild_id, discord_id): member_name for guild_id, discord_id, member_name, _ in votes}
+        links = list(dict.fromkeys(
+            (guild_id, discord_id, ticker)
+            for guild_id, discord_id, _, tickers in votes
+            for ticker in tickers
+        ))
+        while True:
+            cycles = {guild_id: await self._open_cycle(guild_id) for guild_id, _ in members}
+            async with self.pool.acquire() as conn:
+                async with conn.transaction():
+                    # Share-locking the open cycles holds off a concurrent reset_all_data until
+                    # these votes are in; a cycle it closed first is re-resolved and retried.
+                    locked = await conn.fetch("""
+                        SELECT cycle_id FROM cycles
+                        WHERE cycle_id = ANY($1::bigint[]) AND closed_at IS NULL
+                        FOR SHARE
+                    """, list(set(cycles.values())))
+                    closed = set(cycles.values()) - {cycle_id for cycle_id, in locked}
+                    if not closed:
+                        rows = await conn.fetch("""
+                            WITH member AS (
+                                INSERT INTO members (guild_id, discord_id, member_name)
+                                SELECT * FROM unnest($1::bigint[], $2::bigint[], $3::text[])
+                                ON CONFLICT DO NOTHING
+                            ),
+                            linked AS (
+                                INSERT INTO members_requests (cycle_id, guild_id, discord_id, ticker)
+                                SELECT * FROM unnest($7::bigint[], $4::bigint[], $5::bigint[], $6::text[])
+                                ON CONFLICT DO NOTHING
+                                RETURNING cycle_id, guild_id, discord_id, ticker
+                            ),
+                            counted AS (
+                                INSERT INTO requests (cycle_id, guild_id, ticker, votes)
+                                SELECT cycle_id, guild_id, ticker, COUNT(*) FROM linked
+                                GROUP BY cycle_id, guild_id, ticker
+                                ON CONFLICT (cycle_id, ticker) DO UPDATE SET votes = requests.votes + EXCLUDED.votes
+                            )
+                            SELECT guild_id, discord_id, ticker FROM linked
+                        """,
+                            [guild_id for guild_id, _ in members],
+                            [discord_id for _, discord_id in members],
+                            list(members.values()),
+                            [guild_id for guild_id, _, _ in links],
+                            [discord_id for _, discord_id, _ in links],
+                            [ticker for _, _, ticker in links],
+                            [cycles[guild_id] for guild_id, _, _ in links]
+                        )
+                        break
+
+            for guild_id, cycle_id in cycles.items():
+                if cycle_id in closed and self.cycles.get(guild_id) == cycle_id:
+                    self.cycles.pop(guild_id)
+                    self.voters.pop(guild_id, None)
+
+        for guild_id, discord_id, _ in links:
+            # A reset that finished meanwhile already cleared this cycle's voters.
+            if self.cycles.get(guild_id) == cycles[guild_id]:
+                self.voters[guild_id].add(discord_id)
+
+        return {tuple(row) for row in rows}
+
+    @timed(DB_SECONDS, DB_ERRORS, method="add_member_requests")
+    async def add_member_requests(self, guild_id, discord_id, tickers, member_name):
+        """Records a member's votes in one statement; returns (counted, duplicates)."""
+        tickers = list(dict.fromkeys(ticker.upper() for ticker in tickers))
+        try:
+            linked = await self._insert_votes([(guild_id, discord_id, member_name, tickers)])
+        except (Exception, asyncpg.PostgresError) as e:
+            logger.error("DB Error in add_member_requests: %s", e)
+            raise
+
+        counted = [ticker for ticker in tickers if (guild_id, discord_id, ticker) in linked]
+        duplicates = [ticker for ticker in tickers if (guild_id, discord_id, ticker) not in linked]
+        return counted, duplicates
+
+    @timed(DB_SECONDS, DB_ERRORS, method="add_votes")
+    async def add_votes(self, votes):
+        """Records a batch of (guild_id, discord_id, member_name, tickers) votes in one statement."""
+        votes = [
+            (guild_id, discord_id, member_name, [ticker.upper() for ticker in tickers])
+            for guild_id, discord_id, member_name, tickers in votes
+        ]
         try:
-            with self._get_connection() as conn:
-                self._add_member(conn, guild_id, discord_id, member_name)
-                self._add_requests(conn, guild_id, tickers)
-                self._link_member_to_requests(conn, guild_id, discord_id, tickers)
-        except (Exception, psycopg2.Error) as e:
-            print(f"DB Error in add_member_requests: {e}")
+            return await self._insert_votes(votes)
+        except (Exception, asyncpg.PostgresError) as e:
+            logger.error("DB Error in add_votes: %s", e)
             raise
 
-    def requests_count(self, guild_id):
-        with self._get_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT ticker, COUNT(*) as votes
-                    FROM members_requests
-                    WHERE guild_id = %s
-                    GROUP BY ticker
-                    ORDER BY votes DESC
-                """, (guild_id,))
-                return cur.fetchall()
-
-    def has_user_voted(self, guild_id, user_id):
-        with self._get_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT 1 FROM members_requests
-                    WHERE guild_id = %s AND discord_id = %s
-                    LIMIT 1
-                """, (guild_id, user_id))
-                return cur.fetchone() is not None
-
-    def reset_all_data(self, guild_id):
+    @timed(DB_SECONDS, DB_ERRORS, method="requests_count")
+    async def requests_count(self, guild_id, limit=None, offset=0):
+        cycle_id = self.cycles.get(guild_id)
+        if cycle_id is None:
+            return []
+        return await self.pool.fetch("""
+            SELECT ticker, votes
+            FROM requests
+            WHERE cycle_id = $1 AND votes > 0
+            ORDER BY votes DESC, ticker
+            LIMIT $2 OFFSET $3
+        """, cycle_id, limit, offset)
+
+    @timed(DB_SECONDS, DB_ERRORS, method="requests_history")
+    async def requests_history(self, guild_id, since, limit=None):
+        """Total votes per ticker across the open cycle and every cycle closed after `since`."""
+        return await self.pool.fetch("""
+            SELECT r.ticker, SUM(r.votes)::INTEGER AS votes, COUNT(*)::INTEGER AS cycles
+            FROM cycles c
+            JOIN requests r ON r.cycle_id = c.cycle_id
+            WHERE c.guild_id = $1 AND (c.closed_at IS NULL OR c.closed_at >= $2) AND r.votes > 0
+            GROUP BY r.ticker
+            ORDER BY votes DESC, r.ticker
+            LIMIT $3
+        """, guild_id, since, limit)
+
+    @timed(DB_SECONDS, DB_ERRORS, method="has_user_voted")
+    async def has_user_voted(self, guild_id, user_id):
+        voters = self.voters.get(guild_id)
+        return voters is not None and user_id in voters
+
+    def mark_voted(self, guild_id, discord_id):
+        """Records a member as a voter in the guild's open cycle before their votes are written."""
+        self.voters[guild_id].add(discord_id)
+
+    @timed(DB_SECONDS, DB_ERRORS, method="reset_all_data")
+    async def reset_all_data(self, guild_id):
+        # Closing the cycle is a single-row update; the guild's next vote opens a new one
+        # and the closed cycle's votes stay behind as history. The update's row lock waits
+        # for in-flight _insert_votes holding the cycle FOR SHARE, so none land after it.
         try:
-            with self._get_connection() as conn:
-                with conn.cursor() as cur:
-                    cur.execute("DELETE FROM members_requests WHERE guild_id = %s", (guild_id,))
-                    cur.execute("DELETE FROM members WHERE guild_id = %s", (guild_id,))
-                    cur.execute("DELETE FROM requests WHERE guild_id = %s", (guild_id,))
+            await self.pool.execute(
+                "UPDATE cycles SET closed_at = now() WHERE guild_id = $1 AND closed_at IS NULL", guild_id
+            )
+            self.cycles.pop(guild_id, None)
+            self.voters.pop(guild_id, None)
         except Exception as e:
-            print(f"DB Error in reset_all_data: {e}")
+            logger.error("DB Error in reset_all_data: %s", e)
             raise
 
-    def close(self):
-        pass
+    @timed(DB_SECONDS, DB_ERRORS, method="drop_closed_partitions")
+    async def drop_closed_partitions(self, before):
+        """Drops whole partitions whose cycles were all closed before `before`; returns their count."""
+        dropped = 0
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("SELECT pg_advisory_xact_lock(hashtext('reqvest_partitions'))")
+                last_cycle = await conn.fetchval("SELECT max(cycle_id) FROM cycles")
+                for start in await self._partitions(conn):
+                    end = start + self.cycles_per_partition
+                    # A partition still awaiting cycles, or holding a live one, stays.
+                    if last_cycle is None or last_cycle < end - 1:
+                        continue
+                    live = await conn.fetchval("""
+                        SELECT EXISTS (
+                            SELECT 1 FROM cycles
+                            WHERE cycle_id >= $1 AND cycle_id < $2
+                            AND (closed_at IS NULL OR closed_at >= $3)
+                        )
+                    """, start, end, before)
+                    if live:
+                        continue
+
+                    # Detached first: the vote-to-tally foreign key stops a referenced partition
+                    # from being dropped while it is still attached.
+                    for table in ("members_requests", "requests"):
+                        await conn.execute(f"ALTER TABLE {table} DETACH PARTITION {table}_{start}")
+                        await conn.execute(f"DROP TABLE {table}_{start}")
+                    await conn.execute("DELETE FROM cycles WHERE cycle_id >= $1 AND cycle_id < $2", start, end)
+                    self.partitions.discard(start)
+                    dropped += 1
+        return dropped
+
+    async def close(self):
+        if self.pool:
+            await self.pool.close()
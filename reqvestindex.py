@@ -0,0 +1,558 @@
+import bisect
+import contextlib
+import hashlib
+import heapq
+import json
+import logging
+import os
+import pickle
+import re
+from collections import Counter, defaultdict
+import numpy as np
+from rapidfuzz import process, fuzz
+
+logger = logging.getLogger('reqvest_index')
+
+CANDIDATE_LIMIT = 300
+SUGGESTION_LIMIT = 25
+MIN_INDEXED_QUERY = 3
+# Names this short can sit inside a query word without sharing a padded trigram with it
+# ("FG" in "ASDFGH"), so they are also indexed by padded bigram.
+SHORT_NAME_LENGTH = 3
+MAX_TOMBSTONE_RATIO = 0.25
+SCORER_WORKERS = -1
+# Bump whenever CompanyIndex's attributes or clean_company_name change.
+SNAPSHOT_VERSION = 3
+# Names whose ticker is in the first POPULAR_TIER of the ranked list form the popular tier;
+# a popular match scoring at least CONFIDENT_SCORE ends the search without the long tail.
+POPULAR_TIER = 1000
+CONFIDENT_SCORE = 90
+# Everyday names the ranked list cannot produce because its entries are legal names, and
+# large caps it ranks too low to reach the popular tier. A listed ticker always wins over an
+# alias (COKE is Coca-Cola Consolidated, not KO), so no alias may spell one.
+BRAND_ALIASES = {
+    "GOOGLE": ["GOOGL", "GOOG"],
+    "FACEBOOK": ["META"],
+    "JP MORGAN": ["JPM"],
+    "TSMC": ["TSM"],
+    "TAIWAN SEMICONDUCTOR": ["TSM"],
+    "AMEX": ["AXP"],
+    "DISNEY": ["DIS"],
+    "SNAPCHAT": ["SNAP"],
+}
+
+
+def clean_company_name(name):
+    name = re.sub(r'[,\s]*\bNew\b\s*$', '', name, flags=re.IGNORECASE)
+
+    name = re.sub(
+        r'\b(Corporation|Corp\.?|Inc\.?|Incorporated|Ltd\.?|LLC|PLC|S\.A\.|L\.P\.|Group|Holdings?|'
+        r'Company|Co\.?|Class [A-Z]+|Series [A-Z0-9]+|Units?|Warrants?|ETF.*?|Depositary Shares.*?|'
+        r'Common Stock|Preferred Stock|Ordinary Shares|American Depositary Shares)\b',
+        '',
+        name,
+        flags=re.IGNORECASE
+    )
+
+    name = re.sub(r'[^A-Za-z0-9\s]', '', name)
+
+    name = re.sub(r'\s+', ' ', name).strip()
+
+    return name.upper()
+
+
+def build_company_data(filepath):
+    with open(filepath, "r") as f:
+        raw_data = json.load(f)
+
+    company_map = defaultdict(list)
+
+    for entry in raw_data:
+        if entry["market"] not in ["indices", "otc", "fx"]:
+            name = clean_company_name(entry["name"])
+            # name = entry["title"].strip().upper()
+            ticker = entry["ticker"].upper()
+            company_map[name].append(ticker)
+
+    company_to_ticker = {name: sorted(tickers) for name, tickers in company_map.items()}
+    ticker_to_company = {ticker: name for name, tickers in company_to_ticker.items() for ticker in tickers}
+
+    return company_to_ticker, ticker_to_company
+
+
+""" def company_name_scorer(query, choice, **kwargs):
+    return (
+        0.5 * fuzz.partial_ratio(query, choice)
+        + 0.3 * fuzz.token_set_ratio(query, choice)
+        + 0.2 * fuzz.ratio(query, choice)
+    ) """
+
+SCORER_WEIGHTS = (
+    (fuzz.partial_token_set_ratio, 0.35),
+    (fuzz.partial_ratio, 0.25),
+    (fuzz.token_sort_ratio, 0.2),
+    (fuzz.ratio, 0.1),
+    (fuzz.WRatio, 0.1),
+)
+
+def company_name_scorer(query, choice, **kwargs):
+    return sum(weight * scorer(query, choice) for scorer, weight in SCORER_WEIGHTS)
+
+
+def company_name_scores(queries, choices, workers=SCORER_WORKERS):
+    # Same blend as company_name_scorer, computed element-wise over aligned query/choice
+    # sequences with one native multi-threaded pass per scorer.
+    scores = np.zeros(len(queries))
+    for scorer, weight in SCORER_WEIGHTS:
+        scores += weight * process.cpdist(queries, choices, scorer=scorer, dtype=np.float64, workers=workers)
+    return scores
+
+
+# Scorers cheapest first. After each stage, a pair whose blend could not reach its query's
+# best fully scored pair even with full marks from the remaining scorers is dropped, so
+# the costly, lightly weighted WRatio only runs on pairs still in contention.
+SCORER_STAGES = (
+    (fuzz.ratio, fuzz.token_sort_ratio, fuzz.partial_ratio),
+    (fuzz.partial_token_set_ratio,),
+    (fuzz.WRatio,),
+)
+# Bounds are summed in a different order than the blend; this covers the rounding.
+BOUND_SLACK = 1e-6
+
+
+def best_company_name_pairs(pair_queries, pair_choices, bounds, workers=SCORER_WORKERS):
+    """Returns (pair position, score) of the best pair in each [start, end) range of bounds.
+
+    Picks exactly what company_name_scores plus a per-range argmax would, scores included,
+    while scoring most pairs with only the cheaper scorers.
+    """
+    weights = dict(SCORER_WEIGHTS)
+    pair_queries = np.asarray(pair_queries, dtype=object)
+    pair_choices = np.asarray(pair_choices, dtype=object)
+    groups = np.repeat(np.arange(len(bounds)), [end - start for start, end in bounds])
+
+    def score(scorer, positions):
+        return process.cpdist(
+            pair_queries[positions], pair_choices[positions], scorer=scorer, dtype=np.float64, workers=workers
+        )
+
+    raw = {scorer: np.zeros(len(pair_queries)) for scorer, _ in SCORER_WEIGHTS}
+    partial = np.zeros(len(pair_queries))
+    alive = np.arange(len(pair_queries))
+    remaining = 100 * sum(weights.values())
+    for stage, scorers in enumerate(SCORER_STAGES):
+        for scorer in scorers:
+            raw[scorer][alive] = score(scorer, alive)
+            partial[alive] += weights[scorer] * raw[scorer][alive]
+            remaining -= 100 * weights[scorer]
+        if stage == len(SCORER_STAGES) - 1:
+            break
+
+        # Each query's leading pair so far, fully scored, is a floor for its best score.
+        order = alive[np.lexsort((-partial[alive], groups[alive]))]
+        _, first = np.unique(groups[order], return_index=True)
+        leaders = order[first]
+        floor = partial[leaders].copy()
+        for later in SCORER_STAGES[stage + 1:]:
+            for scorer in later:
+                floor += weights[scorer] * score(scorer, leaders)
+        floors = np.full(len(bounds), -np.inf)
+        floors[groups[leaders]] = floor
+        alive = alive[partial[alive] + remaining + BOUND_SLACK >= floors[groups[alive]]]
+
+    # Summed in SCORER_WEIGHTS order, exactly like company_name_scorer.
+    scores = np.zeros(len(alive))
+    for scorer, weight in SCORER_WEIGHTS:
+        scores += weight * raw[scorer][alive]
+
+    best = []
+    for group, (start, end) in enumerate(bounds):
+        lo, hi = np.searchsorted(groups[alive], [group, group + 1])
+        i = lo + int(scores[lo:hi].argmax())
+        best.append((int(alive[i]), float(scores[i])))
+    return best
+
+
+def source_digest(filepath):
+    with open(filepath, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def diff_universes(old, new):
+    """Compares two name -> tickers maps; returns the added, removed and re-tickered names."""
+    return {
+        "added": [name for name in new if name not in old],
+        "removed": [name for name in old if name not in new],
+        "changed": [name for name, tickers in new.items() if name in old and old[name] != tickers]
+    }
+
+
+def bigrams(text):
+    grams = set()
+    for token in text.split():
+        padded = f" {token} "
+        grams.update(padded[i:i + 2] for i in range(len(padded) - 1))
+    return grams
+
+
+def trigrams(text):
+    # Space-padded per token so short words and word boundaries still produce grams.
+    grams = set()
+    for token in text.split():
+        padded = f" {token} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def _updated_postings(postings, dropped, appended):
+    # Only touched posting lists are copied; the rest are shared with the live index.
+    updated = dict(postings)
+    for gram in dropped.keys() | appended.keys():
+        posting = [name_id for name_id in postings.get(gram, ()) if name_id not in dropped[gram]] + appended[gram]
+        if posting:
+            updated[gram] = posting
+        else:
+            updated.pop(gram, None)
+    return updated
+
+
+class CompanyIndex:
+    """Cleaned company names plus a trigram inverted index used to prune fuzzy lookups."""
+
+    # A bare index knows no alternate names or popularity; TieredIndex supplies both.
+    aliases = {}
+
+    def __init__(self, company_to_ticker, ticker_to_company):
+        self.company_to_ticker = company_to_ticker
+        self.ticker_to_company = ticker_to_company
+        self.digest = None
+        self.names = list(company_to_ticker)
+
+        postings = defaultdict(list)
+        short_postings = defaultdict(list)
+        self.gram_counts = []
+        for name_id, name in enumerate(self.names):
+            grams = trigrams(name)
+            self.gram_counts.append(len(grams))
+            for gram in grams:
+                postings[gram].append(name_id)
+            if len(name) <= SHORT_NAME_LENGTH:
+                for gram in bigrams(name):
+                    short_postings[gram].append(name_id)
+        self.postings = dict(postings)
+        self.short_postings = dict(short_postings)
+        self.tombstones = 0
+
+    @classmethod
+    def from_file(cls, filepath, snapshot_path=None):
+        """Loads the index from its compiled snapshot, rebuilding it only when the source changed."""
+        snapshot_path = snapshot_path or f"{filepath}.snapshot"
+        digest = source_digest(filepath)
+
+        index = cls.load_snapshot(snapshot_path, digest)
+        if index is None:
+            index = cls(*build_company_data(filepath))
+            index.digest = digest
+            index.save_snapshot(snapshot_path, digest)
+        return index
+
+    def reloaded(self, filepath, snapshot_path=None):
+        """Rebuilds the index from an updated source by applying only the changed names.
+
+        Returns (index, changes); the live index is never mutated, so callers can swap the
+        result in atomically. changes is None when the source is unchanged.
+        """
+        snapshot_path = snapshot_path or f"{filepath}.snapshot"
+        digest = source_digest(filepath)
+        if digest == self.digest:
+            return self, None
+
+        company_to_ticker, ticker_to_company = build_company_data(filepath)
+        changes = diff_universes(self.company_to_ticker, company_to_ticker)
+
+        if self.tombstones + len(changes["removed"]) > len(self.names) * MAX_TOMBSTONE_RATIO:
+            index = CompanyIndex(company_to_ticker, ticker_to_company)
+        else:
+            index = self._with_names(company_to_ticker, ticker_to_company, changes["removed"], changes["added"])
+        index.digest = digest
+        index.save_snapshot(snapshot_path, digest)
+
+        return index, changes
+
+    def _with_names(self, company_to_ticker, ticker_to_company, removed, added):
+        index = CompanyIndex.__new__(CompanyIndex)
+        index.company_to_ticker = company_to_ticker
+        index.ticker_to_company = ticker_to_company
+        index.digest = None
+        index.names = list(self.names)
+        index.gram_counts = list(self.gram_counts)
+        index.tombstones = self.tombstones + len(removed)
+
+        # Removed names keep their slot as a tombstone so every other name id stays valid.
+        name_ids = {name: name_id for name_id, name in enumerate(self.names) if name is not None}
+        dropped = defaultdict(set)
+        short_dropped = defaultdict(set)
+        for name in removed:
+            name_id = name_ids[name]
+            index.names[name_id] = None
+            for gram in trigrams(name):
+                dropped[gram].add(name_id)
+            if len(name) <= SHORT_NAME_LENGTH:
+                for gram in bigrams(name):
+                    short_dropped[gram].add(name_id)
+
+        appended = defaultdict(list)
+        short_appended = defaultdict(list)
+        for name in added:
+            name_id = len(index.names)
+            grams = trigrams(name)
+            index.names.append(name)
+            index.gram_counts.append(len(grams))
+            for gram in grams:
+                appended[gram].append(name_id)
+            if len(name) <= SHORT_NAME_LENGTH:
+                for gram in bigrams(name):
+                    short_appended[gram].append(name_id)
+
+        index.postings = _updated_postings(self.postings, dropped, appended)
+        index.short_postings = _updated_postings(self.short_postings, short_dropped, short_appended)
+        return index
+
+    @classmethod
+    def load_snapshot(cls, snapshot_path, digest):
+        try:
+            with open(snapshot_path, "rb") as f:
+                snapshot = pickle.load(f)
+            if snapshot.get("version") != SNAPSHOT_VERSION or snapshot.get("digest") != digest:
+                return None
+        except OSError:
+            return None
+        except Exception as e:
+            # A truncated or stale-format pickle can fail in many ways; rebuilding is always safe.
+            logger.warning("Ignoring unreadable index snapshot %s: %r", snapshot_path, e)
+            return None
+
+        index = cls.__new__(cls)
+        index.__dict__.update(snapshot["state"])
+        return index
+
+    def save_snapshot(self, snapshot_path, digest):
+        snapshot = {"version": SNAPSHOT_VERSION, "digest": digest, "state": self.__dict__}
+        # Shard processes starting together each write their own temp file.
+        tmp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, snapshot_path)
+        except OSError as e:
+            logger.warning("Could not write index snapshot %s: %s", snapshot_path, e)
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+
+    def candidates(self, query, limit=CANDIDATE_LIMIT):
+        if len(query) < MIN_INDEXED_QUERY:
+            return []
+
+        overlap = Counter()
+        for gram in trigrams(query):
+            overlap.update(self.postings.get(gram, ()))
+        if not overlap:
+            return []
+
+        # Half the slots go to the largest raw overlaps (names containing the query),
+        # half to names mostly contained in the query, which partial_ratio rewards.
+        name_ids = {name_id for name_id, _ in overlap.most_common(limit // 2)}
+        name_ids.update(heapq.nsmallest(
+            limit // 2,
+            overlap,
+            key=lambda name_id: (-overlap[name_id] / self.gram_counts[name_id], -overlap[name_id])
+        ))
+        for gram in bigrams(query):
+            name_ids.update(self.short_postings.get(gram, ()))
+
+        # Score in original name order so ties resolve exactly like a full scan.
+        return [self.names[name_id] for name_id in sorted(name_ids)]
+
+    def best_match(self, query):
+        return self.best_matches([query])[0]
+
+    def ranked(self, tickers):
+        return tickers
+
+    def best_matches(self, queries):
+        """Resolve several queries in one vectorized pass; returns (match, score) per query."""
+        if not queries:
+            return []
+
+        pair_queries = []
+        pair_choices = []
+        bounds = []
+        for query in queries:
+            # Queries too short to index, or sharing no grams, fall back to a full scan.
+            choices = self.candidates(query) or list(self.company_to_ticker)
+            bounds.append((len(pair_choices), len(pair_choices) + len(choices)))
+            pair_queries.extend([query] * len(choices))
+            pair_choices.extend(choices)
+
+        return [
+            (pair_choices[best], score)
+            for best, score in best_company_name_pairs(pair_queries, pair_choices, bounds)
+        ]
+
+
+def load_popularity(filepath):
+    """Maps each symbol in the ranked (roughly market-cap ordered) list to its position."""
+    with open(filepath, "r") as f:
+        ranked = json.load(f)
+
+    ranks = {}
+    for rank, entry in enumerate(ranked):
+        symbol = entry["symbol"].upper()
+        # The ranked list uses SEC share-class symbols (BRK-B); Polygon uses BRK.B.
+        ranks.setdefault(symbol, rank)
+        ranks.setdefault(symbol.replace("-", "."), rank)
+    return ranks
+
+
+def load_aliases(filepath, limit=POPULAR_TIER):
+    """Maps alternate names from the ranked list to their symbols, most popular first.
+
+    Every entry contributes its cleaned name. The first `limit` entries also contribute their
+    leading word ("JPMORGAN"), unless that word starts some other company's name too.
+    """
+    with open(filepath, "r") as f:
+        ranked = json.load(f)
+
+    aliases = defaultdict(list)
+    owners = defaultdict(set)
+    leading = []
+    for rank, entry in enumerate(ranked):
+        symbol = entry["symbol"].upper()
+        name = clean_company_name(entry["name"])
+        if not name:
+            continue
+        aliases[name].append(symbol)
+        first = name.split()[0]
+        owners[first].add(name)
+        if rank < limit:
+            leading.append((first, symbol))
+
+    for first, symbol in leading:
+        if len(owners[first]) == 1 and symbol not in aliases[first]:
+            aliases[first].append(symbol)
+    for alias, symbols in BRAND_ALIASES.items():
+        aliases.setdefault(alias, list(symbols))
+    return dict(aliases)
+
+
+class TieredIndex:
+    """Searches the ranked list before the whole universe.
+
+    Aliases are exact lookups; fuzzy queries are scored against the popular tier first and
+    only reach the long tail when no popular name is a confident match. Everything else is
+    delegated to the wrapped CompanyIndex or CompactCompanyIndex.
+    """
+
+    def __init__(self, index, ranks, aliases, popular_size=POPULAR_TIER):
+        self.index = index
+        # Bound directly: exact lookups are the hot path and should not go through __getattr__.
+        self.company_to_ticker = index.company_to_ticker
+        self.ticker_to_company = index.ticker_to_company
+        self.ranks = ranks
+        self.alias_source = aliases
+        self.popular_size = popular_size
+
+        # The ranked list uses SEC share-class symbols (BRK-B); Polygon uses BRK.B. Aliases that
+        # spell a listed ticker are dropped, since exact_outcome resolves the ticker first.
+        known = index.ticker_to_company
+        self.aliases = {}
+        for alias, symbols in aliases.items():
+            if alias in known:
+                continue
+            resolved = [symbol if symbol in known else symbol.replace("-", ".") for symbol in symbols]
+            resolved = list(dict.fromkeys(ticker for ticker in resolved if ticker in known))
+            if resolved:
+                self.aliases[alias] = resolved
+
+        popular = {
+            name: tickers for name, tickers in index.company_to_ticker.items()
+            if min(ranks.get(ticker, popular_size) for ticker in tickers) < popular_size
+        }
+        self.popular = CompanyIndex(popular, {ticker: name for name, tickers in popular.items() for ticker in tickers})
+
+    @classmethod
+    def from_file(cls, index, filepath, popular_size=POPULAR_TIER):
+        return cls(index, load_popularity(filepath), load_aliases(filepath, popular_size), popular_size)
+
+    def __getattr__(self, name):
+        return getattr(self.index, name)
+
+    def reloaded(self, filepath, snapshot_path=None):
+        index, changes = self.index.reloaded(filepath, snapshot_path)
+        if changes is None:
+            return self, None
+        return TieredIndex(index, self.ranks, self.alias_source, self.popular_size), changes
+
+    def ranked(self, tickers):
+        unranked = len(self.ranks)
+        return sorted(tickers, key=lambda ticker: (self.ranks.get(ticker, unranked), ticker))
+
+    def best_match(self, query):
+        return self.best_matches([query])[0]
+
+    def best_matches(self, queries):
+        if not self.popular.names:
+            return self.index.best_matches(queries)
+
+        matches = self.popular.best_matches(queries)
+        unsure = [i for i, (_, score) in enumerate(matches) if score < CONFIDENT_SCORE]
+        if unsure:
+            # The tail scan covers the popular names too; a popular match keeps ties.
+            for i, (match, score) in zip(unsure, self.index.best_matches([queries[i] for i in unsure])):
+                if score > matches[i][1]:
+                    matches[i] = (match, score)
+        return matches
+
+
+class PrefixIndex:
+    """Sorted-array prefix index over tickers and cleaned names, ranked by popularity.
+
+    Prefixes up to PRECOMPUTED_PREFIX characters long cover huge ranges of the array, so
+    their top suggestions are computed up front; longer prefixes rank their bisected range.
+    """
+
+    PRECOMPUTED_PREFIX = 2
+
+    def __init__(self, company_index, ranks, limit=SUGGESTION_LIMIT):
+        unranked = len(ranks)
+        entries = []
+        for ticker, name in company_index.ticker_to_company.items():
+            entries.append((ticker, ranks.get(ticker, unranked), f"{ticker} · {name}", ticker))
+        for name, tickers in company_index.company_to_ticker.items():
+            rank = min(ranks.get(ticker, unranked) for ticker in tickers)
+            entries.append((name, rank, f"{name} ({', '.join(tickers)})", name))
+        entries.sort()
+
+        self.limit = limit
+        self.keys = [key for key, _, _, _ in entries]
+        self.order = [(rank, len(key), key) for key, rank, _, _ in entries]
+        self.suggestions = [(label[:100], value) for _, _, label, value in entries]
+
+        buckets = defaultdict(list)
+        for entry_id, key in enumerate(self.keys):
+            for length in range(min(len(key), self.PRECOMPUTED_PREFIX) + 1):
+                buckets[key[:length]].append(entry_id)
+        self.top = {
+            prefix: heapq.nsmallest(limit, entry_ids, key=self.order.__getitem__)
+            for prefix, entry_ids in buckets.items()
+        }
+
+    def suggest(self, prefix, limit=None):
+        limit = limit or self.limit
+        if len(prefix) <= self.PRECOMPUTED_PREFIX:
+            entry_ids = self.top.get(prefix, [])[:limit]
+        else:
+            lo = bisect.bisect_left(self.keys, prefix)
+            hi = bisect.bisect_left(self.keys, prefix + "\uffff", lo)
+            entry_ids = heapq.nsmallest(limit, range(lo, hi), key=self.order.__getitem__)
+        return [self.suggestions[entry_id] for entry_id in entry_ids]
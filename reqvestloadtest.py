@@ -0,0 +1,391 @@
+import argparse
+import asyncio
+import json
+import random
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import reqvest
+from reqvestplans import scratch_database
+
+# Drives the real slash-command, select and on_message handlers with stand-in Discord
+# objects, so everything from request parsing to the database is exercised without a
+# gateway connection. Run it from the bot's directory so tickers.json is found.
+
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.display_name = f"user{user_id}"
+        self.mention = f"<@{user_id}>"
+        self.bot = False
+
+
+class FakeDiscord:
+    """Stands in for Discord's HTTP API: every call takes `latency` seconds and is counted."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+
+    async def call(self):
+        self.calls += 1
+        # Even at zero latency a real API call yields to the event loop.
+        await asyncio.sleep(self.latency)
+
+
+class FakeChannel:
+    def __init__(self, discord):
+        self.discord = discord
+
+    async def send(self, content=None, **kwargs):
+        await self.discord.call()
+
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self.interaction = interaction
+        self.done = False
+
+    def is_done(self):
+        return self.done
+
+    async def defer(self, **kwargs):
+        self.done = True
+        await self.interaction.discord.call()
+
+    async def send_message(self, content=None, view=None, **kwargs):
+        self.done = True
+        await self.interaction.sent(view)
+
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self.interaction = interaction
+
+    async def send(self, content=None, view=None, **kwargs):
+        await self.interaction.sent(view)
+
+
+class FakeInteraction:
+    def __init__(self, discord, guild_id, user):
+        self.discord = discord
+        self.guild_id = guild_id
+        self.user = user
+        self.channel = FakeChannel(discord)
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+        self.views = []
+
+    async def sent(self, view):
+        if view is not None:
+            self.views.append(view)
+        await self.discord.call()
+
+    async def edit_original_response(self, **kwargs):
+        await self.discord.call()
+
+
+class FakeGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+
+
+class FakeMessage:
+    def __init__(self, discord, guild_id, user, content):
+        self.author = user
+        self.guild = FakeGuild(guild_id)
+        self.channel = FakeChannel(discord)
+        self.content = content
+
+
+class MemoryDatabase:
+    """In-memory stand-in with the same interface and vote semantics as Database."""
+
+    def __init__(self):
+        self.votes = defaultdict(set)
+        self.tally = defaultdict(lambda: defaultdict(int))
+        self.voters = defaultdict(set)
+        # (closed_at, tally) for every reset cycle, for requests_history.
+        self.closed = defaultdict(list)
+
+    async def add_member_requests(self, guild_id, discord_id, tickers, member_name):
+        counted = []
+        duplicates = []
+        for ticker in dict.fromkeys(ticker.upper() for ticker in tickers):
+            if (discord_id, ticker) in self.votes[guild_id]:
+                duplicates.append(ticker)
+            else:
+                self.votes[guild_id].add((discord_id, ticker))
+                self.tally[guild_id][ticker] += 1
+                counted.append(ticker)
+        if counted:
+            self.mark_voted(guild_id, discord_id)
+        return counted, duplicates
+
+    async def add_votes(self, votes):
+        for guild_id, discord_id, member_name, tickers in votes:
+            await self.add_member_requests(guild_id, discord_id, tickers, member_name)
+
+    async def requests_count(self, guild_id, limit=None, offset=0):
+        rows = sorted(self.tally[guild_id].items(), key=lambda row: (-row[1], row[0]))
+        return rows[offset:None if limit is None else offset + limit]
+
+    async def requests_history(self, guild_id, since, limit=None):
+        cycles = [self.tally[guild_id]] + [tally for closed_at, tally in self.closed[guild_id] if closed_at >= since]
+        totals = defaultdict(lambda: [0, 0])
+        for tally in cycles:
+            for ticker, votes in tally.items():
+                totals[ticker][0] += votes
+                totals[ticker][1] += 1
+        rows = sorted(((ticker, votes, count) for ticker, (votes, count) in totals.items()), key=lambda row: (-row[1], row[0]))
+        return rows[:limit]
+
+    async def has_user_voted(self, guild_id, user_id):
+        return user_id in self.voters.get(guild_id, ())
+
+    def mark_voted(self, guild_id, discord_id):
+        self.voters[guild_id].add(discord_id)
+
+    async def reset_all_data(self, guild_id):
+        tally = self.tally.pop(guild_id, None)
+        if tally:
+            self.closed[guild_id].append((datetime.now(timezone.utc), tally))
+        self.votes.pop(guild_id, None)
+        self.voters.pop(guild_id, None)
+
+    async def close(self):
+        pass
+
+
+def request_corpus(index, rng, size=2000):
+    """Submissions shaped like real traffic: tickers, names, typos, ambiguous names, lists."""
+    names = [name for name in index.company_to_ticker if name]
+    tickers = list(index.ticker_to_company)
+    ambiguous = [name for name in names if len(index.company_to_ticker[name]) > 1]
+
+    def typo(name):
+        i = rng.randrange(len(name))
+        return name[:i] + rng.choice("AEIOUXZ") + name[i + 1:]
+
+    def one():
+        kind = rng.random()
+        if kind < 0.35:
+            return rng.choice(tickers)
+        if kind < 0.6:
+            return rng.choice(names).title()
+        if kind < 0.85:
+            return typo(rng.choice(names))
+        return rng.choice(ambiguous or names)
+
+    return [", ".join(one() for _ in range(rng.randint(1, 4))) for _ in range(size)]
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class StallMonitor:
+    """Samples event-loop wake-up delay; anything past the sleep interval is a stall."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stalled = 0.0
+        self.worst = 0.0
+        self._started = None
+        self._task = None
+
+    def _record(self, loop):
+        lag = loop.time() - self._started - self.interval
+        if lag > self.interval:
+            self.stalled += lag
+            self.worst = max(self.worst, lag)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._started = loop.time()
+            await asyncio.sleep(self.interval)
+            self._record(loop)
+
+    def start(self):
+        self._started = asyncio.get_running_loop().time()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # The sleep in flight when the run ends may itself have been stalled.
+        self._record(asyncio.get_running_loop())
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+class LoadTest:
+    def __init__(self, operations, concurrency, mix, guilds, users, latency, seed):
+        self.operations = operations
+        self.concurrency = concurrency
+        self.mix = mix
+        self.guilds = [(n + 1) << 22 for n in range(guilds)]
+        self.users = users
+        self.discord = FakeDiscord(latency)
+        self.rng = random.Random(seed)
+        self.corpus = request_corpus(reqvest.company_index, self.rng)
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def _actor(self):
+        return self.rng.choice(self.guilds), FakeUser(self.rng.randrange(1, self.users + 1))
+
+    async def _timed(self, kind, coro):
+        started = time.perf_counter()
+        try:
+            await coro
+        except Exception as e:
+            self.errors[f"{kind}: {type(e).__name__}: {e}"] += 1
+        finally:
+            self.latencies[kind].append(time.perf_counter() - started)
+
+    async def request(self):
+        guild_id, user = self._actor()
+        interaction = FakeInteraction(self.discord, guild_id, user)
+        await self._timed("request", reqvest.request.callback(interaction, stocks=self.rng.choice(self.corpus)))
+
+        # Answer each "Multiple tickers found" prompt the way a user would, one at a time.
+        while interaction.views:
+            view = interaction.views.pop(0)
+            select = view.select
+            select._values = [self.rng.choice(select.options).value]
+            followup = FakeInteraction(self.discord, guild_id, user)
+            await self._timed("select", select.callback(followup))
+            interaction.views.extend(followup.views)
+
+    async def count(self):
+        guild_id, user = self._actor()
+        await self._timed("count", reqvest.count.callback(FakeInteraction(self.discord, guild_id, user), page=1))
+
+    async def message(self):
+        guild_id, user = self._actor()
+        await self._timed("on_message", reqvest.on_message(FakeMessage(self.discord, guild_id, user, "gm")))
+
+    async def _worker(self, remaining):
+        kinds = list(self.mix)
+        weights = [self.mix[kind] for kind in kinds]
+        while remaining:
+            remaining.pop()
+            kind = self.rng.choices(kinds, weights)[0]
+            await getattr(self, kind)()
+
+    async def run(self):
+        monitor = StallMonitor()
+        monitor.start()
+        remaining = list(range(self.operations))
+        started = time.perf_counter()
+        await asyncio.gather(*(self._worker(remaining) for _ in range(self.concurrency)))
+        elapsed = time.perf_counter() - started
+        await monitor.stop()
+
+        report = {
+            "operations": self.operations,
+            "concurrency": self.concurrency,
+            "seconds": round(elapsed, 3),
+            "throughput": round(self.operations / elapsed, 1),
+            "loop_stall_seconds": round(monitor.stalled, 3),
+            "loop_stall_share": round(monitor.stalled / elapsed, 3),
+            "worst_stall_ms": round(monitor.worst * 1000, 2),
+            "discord_calls": self.discord.calls,
+            "latency_ms": {},
+            "errors": dict(self.errors),
+        }
+        for kind, values in sorted(self.latencies.items()):
+            values.sort()
+            report["latency_ms"][kind] = {
+                "count": len(values),
+                "p50": round(percentile(values, 0.50) * 1000, 2),
+                "p95": round(percentile(values, 0.95) * 1000, 2),
+                "p99": round(percentile(values, 0.99) * 1000, 2),
+                "max": round(values[-1] * 1000, 2),
+            }
+        return report
+
+
+def print_report(report):
+    print(
+        f"{report['operations']} operations at concurrency {report['concurrency']} in "
+        f"{report['seconds']}s: {report['throughput']} ops/s"
+    )
+    print(
+        f"Event loop stalled {report['loop_stall_seconds']}s "
+        f"({report['loop_stall_share']:.1%} of the run), worst stall {report['worst_stall_ms']} ms"
+    )
+    print(f"{'handler':<12}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for kind, stats in report["latency_ms"].items():
+        print(f"{kind:<12}{stats['count']:>8}{stats['p50']:>10}{stats['p95']:>10}{stats['p99']:>10}{stats['max']:>10}")
+    for error, count in report["errors"].items():
+        print(f"{count} x {error}")
+
+
+async def run(args):
+    mix = {"request": args.request_weight, "count": args.count_weight, "message": args.message_weight}
+    # on_message ends by handing the message to discord.py's prefix-command dispatch, which
+    # needs a logged-in client; the bot registers no prefix commands, so it is skipped.
+    async def process_commands(message):
+        pass
+    reqvest.bot.process_commands = process_commands
+
+    async def attach(db):
+        if args.write_behind:
+            from reqvestqueue import VoteQueue
+            db = VoteQueue(db, f"{tempfile.mkdtemp()}/vote_journal.jsonl")
+            await db.start()
+        reqvest.bot.db = db
+        test = LoadTest(
+            args.operations, args.concurrency, mix, args.guilds, args.users, args.discord_latency / 1000, args.seed
+        )
+        try:
+            return await test.run()
+        finally:
+            await db.close()
+
+    if not args.postgres:
+        return await attach(MemoryDatabase())
+
+    from reqvestdb import Database
+    async with scratch_database("reqvest_loadtest") as settings:
+        db = Database(*settings, max_size=args.pool_size)
+        await db.connect()
+        await db.migrate()
+        await db.load_voters()
+        return await attach(db)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the bot's handlers with simulated traffic.")
+    parser.add_argument("--operations", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--guilds", type=int, default=3)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--request-weight", type=float, default=0.7)
+    parser.add_argument("--count-weight", type=float, default=0.1)
+    parser.add_argument("--message-weight", type=float, default=0.2)
+    parser.add_argument("--discord-latency", type=float, default=0, help="simulated Discord API latency, ms")
+    parser.add_argument("--postgres", action="store_true", help="use a scratch database on the configured server")
+    parser.add_argument("--pool-size", type=int, default=10)
+    parser.add_argument("--write-behind", action="store_true", help="put the vote write-behind queue in front")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+if __name__ == "__main__":
+    main()
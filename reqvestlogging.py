@@ -0,0 +1,152 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import time
+
+# Each subsystem's level comes from LOG_LEVEL_<NAME>, falling back to LOG_LEVEL.
+SUBSYSTEMS = {
+    "bot": ("reqvest_bot",),
+    "db": ("reqvest_db", "reqvest_queue"),
+    "resolver": ("reqvest_resolver", "reqvest_index", "reqvest_providers"),
+    "discord": ("discord",),
+}
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        if getattr(record, "repeated", 0):
+            entry["repeated"] = record.repeated
+        return json.dumps(entry)
+
+
+class RepeatFilter(logging.Filter):
+    """Lets an identical warning or error line through at most once per `window` seconds.
+
+    The next copy to get through carries the number of copies dropped in between.
+    """
+
+    def __init__(self, window=60, min_level=logging.WARNING, max_keys=1000):
+        super().__init__()
+        self.window = window
+        self.min_level = min_level
+        self.max_keys = max_keys
+        self.seen = {}
+
+    def filter(self, record):
+        if record.levelno < self.min_level:
+            return True
+
+        key = (record.name, record.levelno, record.msg, str(record.args))
+        now = time.monotonic()
+        entry = self.seen.get(key)
+        if entry is not None and now - entry[0] < self.window:
+            entry[1] += 1
+            return False
+
+        record.repeated = entry[1] if entry else 0
+        if record.repeated:
+            record.msg = f"{record.msg} (repeated {record.repeated} times)"
+        if len(self.seen) >= self.max_keys:
+            self.seen.clear()
+        self.seen[key] = [now, 0]
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # The stock prepare() formats the whole record on the calling thread. Only the
+        # message is resolved here; formatting and tracebacks happen on the listener thread.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def _level(name, default, invalid):
+    value = os.getenv(name)
+    if not value:
+        return default
+    level = logging.getLevelName(value.upper()) if not value.isdigit() else int(value)
+    if not isinstance(level, int):
+        invalid.append((name, value))
+        return default
+    return level
+
+
+def _handlers():
+    formatter = JsonFormatter() if os.getenv("LOG_FORMAT", "").lower() == "json" else logging.Formatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler()]
+    log_file = os.getenv("LOG_FILE")
+    if log_file:
+        handlers.append(logging.handlers.WatchedFileHandler(log_file))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def _install(*handlers):
+    """Replaces the root handlers and applies LOG_LEVEL and the per-subsystem levels."""
+    invalid = []
+    default_level = _level("LOG_LEVEL", logging.INFO, invalid)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(default_level)
+
+    for subsystem, names in SUBSYSTEMS.items():
+        level = _level(f"LOG_LEVEL_{subsystem.upper()}", default_level, invalid)
+        for name in names:
+            logging.getLogger(name).setLevel(level)
+
+    for name, value in invalid:
+        logging.getLogger("reqvest_logging").warning(
+            "Unknown log level %s=%r, using %s", name, value, logging.getLevelName(default_level)
+        )
+
+
+def setup_logging(start=True):
+    """Routes every record through a queue to a background thread that formats and writes it.
+
+    With start=False the listener thread is left to the caller's start_listener, so worker
+    processes can be forked first; records wait in the queue until then.
+    """
+    handlers = _handlers()
+    records = queue.SimpleQueue()
+    queue_handler = _QueueHandler(records)
+    queue_handler.addFilter(RepeatFilter(float(os.getenv("LOG_REPEAT_WINDOW", "60"))))
+    _install(queue_handler)
+
+    listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    if start:
+        start_listener(listener)
+    return listener
+
+
+def start_listener(listener):
+    listener.start()
+    atexit.register(listener.stop)
+
+
+def setup_worker_logging():
+    """Logging for forked worker processes, which inherit the root queue handler but not the
+    listener thread that drains it; workers write to the handlers directly instead."""
+    handlers = _handlers()
+    for handler in handlers:
+        handler.addFilter(RepeatFilter(float(os.getenv("LOG_REPEAT_WINDOW", "60"))))
+    _install(*handlers)
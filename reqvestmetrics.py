@@ -0,0 +1,266 @@
+import asyncio
+import bisect
+import functools
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+from aiohttp import web
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels[name]) for name in labelnames)
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames, key, extra=()):
+    pairs = [*zip(labelnames, key), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Gauge:
+    """A gauge that is either set directly or read from `collect` at scrape time.
+
+    collect returns {label tuple: value}, so live objects such as caches are reported
+    without the hot path having to keep a gauge up to date.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=(), collect=None):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.collect = collect
+        self.values = {}
+
+    def set(self, value, **labels):
+        self.values[_label_key(self.labelnames, labels)] = value
+
+    def samples(self):
+        values = self.collect() if self.collect else self.values
+        for key, value in values.items():
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # label key -> [per-bucket counts (last is +Inf), sum, count]
+        self.values = {}
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        entry = self.values.get(key)
+        if entry is None:
+            entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def samples(self):
+        for key, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += bucket_count
+                le = bound if isinstance(bound, str) else repr(float(bound))
+                yield f"{self.name}_bucket", _format_labels(self.labelnames, key, [("le", le)]), cumulative
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def _register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=(), collect=None):
+        return self._register(Gauge(name, help, labelnames, collect))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def render(self):
+        """Prometheus text exposition format, version 0.0.4."""
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+COMMAND_SECONDS = REGISTRY.histogram(
+    "reqvest_command_seconds", "Slash command and event handler latency.", ("command",)
+)
+COMMAND_ERRORS = REGISTRY.counter(
+    "reqvest_command_errors_total", "Handlers that raised.", ("command",)
+)
+DB_SECONDS = REGISTRY.histogram(
+    "reqvest_db_seconds", "Database method latency.", ("method",)
+)
+DB_ERRORS = REGISTRY.counter(
+    "reqvest_db_errors_total", "Database methods that raised.", ("method",)
+)
+RESOLVE_SECONDS = REGISTRY.histogram(
+    "reqvest_resolve_seconds", "Request resolution latency by stage.", ("stage",)
+)
+RESOLVE_OUTCOMES = REGISTRY.counter(
+    "reqvest_resolve_outcomes_total", "Resolved requests by the path that answered them.", ("path",)
+)
+LOOP_LAG_SECONDS = REGISTRY.histogram(
+    "reqvest_event_loop_lag_seconds", "How late the event loop woke a sleeping monitor task."
+)
+
+
+def timed(histogram, errors=None, **labels):
+    """Decorates a coroutine function so every call is observed in `histogram`.
+
+    functools.wraps keeps the signature visible, so it can sit directly under discord.py's
+    command decorators.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except BaseException:
+                if errors is not None:
+                    errors.inc(**labels)
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - started, **labels)
+        return wrapper
+    return decorator
+
+
+async def monitor_loop_lag(interval=0.5):
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        LOOP_LAG_SECONDS.observe(max(0.0, loop.time() - started - interval))
+
+
+class SamplingProfiler:
+    """Samples one thread's Python stack on a timer, in collapsed flame-graph format.
+
+    It runs on its own thread, so a blocked event loop is still sampled, and it is cheap
+    enough to leave on while looking for what stalls the loop.
+    """
+
+    def __init__(self, thread_id=None, interval=0.01, max_depth=64):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = StackCounter()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                with self._lock:
+                    self.stacks[";".join(reversed(stack))] += 1
+
+    def render(self, reset=False):
+        with self._lock:
+            text = "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+            if reset:
+                self.stacks.clear()
+        return text
+
+
+async def start_server(host, port, profiler=None, registry=REGISTRY):
+    """Serves /metrics, plus /profile when a profiler is attached. Returns the runner to clean up."""
+    async def metrics(request):
+        return web.Response(
+            body=registry.render().encode("utf-8"),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+        )
+
+    async def profile(request):
+        return web.Response(text=profiler.render(reset="reset" in request.query), content_type="text/plain")
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    if profiler:
+        app.router.add_get("/profile", profile)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
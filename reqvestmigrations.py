@@ -0,0 +1,182 @@
+import logging
+
+logger = logging.getLogger('reqvest_db')
+
+# Migrations are applied in order, each in its own transaction, and recorded in
+# schema_migrations. They are written to be safe on databases created before the runner
+# existed, which already have some of these objects but no record of them.
+
+
+async def _is_partitioned(conn, table):
+    return await conn.fetchval("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass($1)", table)
+
+
+async def initial_schema(db, conn):
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS members (
+            guild_id BIGINT,
+            discord_id BIGINT,
+            member_name TEXT NOT NULL,
+            PRIMARY KEY (guild_id, discord_id)
+        )
+    ''')
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS requests (
+            guild_id BIGINT,
+            ticker TEXT,
+            PRIMARY KEY (guild_id, ticker)
+        )
+    ''')
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS members_requests (
+            guild_id BIGINT,
+            discord_id BIGINT,
+            ticker TEXT,
+            PRIMARY KEY (guild_id, discord_id, ticker),
+            FOREIGN KEY (guild_id, discord_id) REFERENCES members(guild_id, discord_id) ON DELETE CASCADE,
+            FOREIGN KEY (guild_id, ticker) REFERENCES requests(guild_id, ticker) ON DELETE CASCADE
+        )
+    ''')
+
+
+async def vote_tally(db, conn):
+    # requests.votes is kept in step with members_requests so /count never has to aggregate.
+    if await _is_partitioned(conn, "requests"):
+        return
+
+    has_votes = await conn.fetchval("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'requests' AND column_name = 'votes'
+    """)
+    if not has_votes:
+        await conn.execute("ALTER TABLE requests ADD COLUMN votes INTEGER NOT NULL DEFAULT 0")
+        await conn.execute("""
+            UPDATE requests r
+            SET votes = c.votes
+            FROM (
+                SELECT guild_id, ticker, COUNT(*) AS votes
+                FROM members_requests
+                GROUP BY guild_id, ticker
+            ) c
+            WHERE r.guild_id = c.guild_id AND r.ticker = c.ticker
+        """)
+    await conn.execute("""
+        CREATE INDEX IF NOT EXISTS requests_guild_votes_idx
+        ON requests (guild_id, votes DESC, ticker)
+    """)
+
+
+async def cycle_partitions(db, conn):
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS cycles (
+            cycle_id BIGSERIAL PRIMARY KEY,
+            guild_id BIGINT NOT NULL,
+            opened_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            closed_at TIMESTAMPTZ
+        )
+    ''')
+    # At most one open cycle per guild; also serves the open-cycle lookup.
+    await conn.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS cycles_open_idx
+        ON cycles (guild_id) WHERE closed_at IS NULL
+    ''')
+    await conn.execute('''
+        CREATE INDEX IF NOT EXISTS cycles_guild_closed_idx
+        ON cycles (guild_id, closed_at)
+    ''')
+
+    if await _is_partitioned(conn, "requests"):
+        return
+
+    for table in ("members_requests", "requests"):
+        await conn.execute(f"ALTER TABLE {table} RENAME TO {table}_legacy")
+        await conn.execute(f"ALTER INDEX {table}_pkey RENAME TO {table}_legacy_pkey")
+    await conn.execute("DROP INDEX IF EXISTS requests_guild_votes_idx")
+
+    # Vote rows live in range partitions of cycle ids, cycles_per_partition cycles each,
+    # so closed cycles can be dropped a partition at a time.
+    await conn.execute('''
+        CREATE TABLE requests (
+            cycle_id BIGINT,
+            guild_id BIGINT NOT NULL,
+            ticker TEXT,
+            votes INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (cycle_id, ticker)
+        ) PARTITION BY RANGE (cycle_id)
+    ''')
+    await conn.execute('''
+        CREATE TABLE members_requests (
+            cycle_id BIGINT,
+            guild_id BIGINT NOT NULL,
+            discord_id BIGINT,
+            ticker TEXT,
+            voted_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (cycle_id, discord_id, ticker),
+            FOREIGN KEY (guild_id, discord_id) REFERENCES members(guild_id, discord_id) ON DELETE CASCADE,
+            FOREIGN KEY (cycle_id, ticker) REFERENCES requests(cycle_id, ticker) ON DELETE CASCADE
+        ) PARTITION BY RANGE (cycle_id)
+    ''')
+    await conn.execute('''
+        CREATE INDEX requests_cycle_votes_idx
+        ON requests (cycle_id, votes DESC, ticker)
+    ''')
+
+    # Everything recorded before cycles existed becomes each guild's open cycle.
+    cycles = await conn.fetch("""
+        INSERT INTO cycles (guild_id)
+        SELECT DISTINCT guild_id FROM requests_legacy
+        RETURNING cycle_id
+    """)
+    for cycle_id, in cycles:
+        await db._ensure_partition(conn, cycle_id)
+
+    await conn.execute("""
+        INSERT INTO requests (cycle_id, guild_id, ticker, votes)
+        SELECT c.cycle_id, r.guild_id, r.ticker, COUNT(mr.discord_id)
+        FROM requests_legacy r
+        JOIN cycles c ON c.guild_id = r.guild_id AND c.closed_at IS NULL
+        LEFT JOIN members_requests_legacy mr ON mr.guild_id = r.guild_id AND mr.ticker = r.ticker
+        GROUP BY c.cycle_id, r.guild_id, r.ticker
+    """)
+    await conn.execute("""
+        INSERT INTO members_requests (cycle_id, guild_id, discord_id, ticker)
+        SELECT c.cycle_id, mr.guild_id, mr.discord_id, mr.ticker
+        FROM members_requests_legacy mr
+        JOIN cycles c ON c.guild_id = mr.guild_id AND c.closed_at IS NULL
+    """)
+    await conn.execute("DROP TABLE members_requests_legacy, requests_legacy")
+
+
+MIGRATIONS = [
+    (1, "members, requests and members_requests tables", initial_schema),
+    (2, "requests.votes tally", vote_tally),
+    (3, "request cycles and cycle-partitioned vote tables", cycle_partitions),
+]
+
+
+async def migrate(db):
+    """Applies every migration newer than the database's schema; returns the versions applied."""
+    applied = []
+    async with db.pool.acquire() as conn:
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        """)
+        for version, description, apply in MIGRATIONS:
+            async with conn.transaction():
+                # Shard processes start together; the first one migrates, the rest wait and skip.
+                await conn.execute("SELECT pg_advisory_xact_lock(hashtext('reqvest_migrations'))")
+                if await conn.fetchval("SELECT 1 FROM schema_migrations WHERE version = $1", version):
+                    continue
+
+                logger.info("Applying schema migration %d: %s", version, description)
+                await apply(db, conn)
+                await conn.execute(
+                    "INSERT INTO schema_migrations (version, description) VALUES ($1, $2)",
+                    version, description
+                )
+                applied.append(version)
+    return applied
@@ -0,0 +1,121 @@
+import asyncio
+import asyncpg
+import contextlib
+import json
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+from reqvestdb import Database
+
+load_dotenv()
+
+PLANNED_STATEMENTS = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+
+async def exercise(db):
+    """Calls every Database query path once, against a freshly migrated database."""
+    guilds = [(n + 1) << 22 for n in range(3)]
+    for guild_id in guilds:
+        await db.add_member_requests(guild_id, 10, ["AAPL", "MSFT"], "alice")
+    await db.add_votes([(guilds[0], 11, "bob", ["AAPL", "NVDA"]), (guilds[1], 12, "carol", ["TSLA"])])
+    await db.load_voters()
+    await db.load_voters([0, 1], 2)
+    await db.requests_count(guilds[0], 25, 0)
+    await db.requests_history(guilds[0], datetime.now(timezone.utc) - timedelta(weeks=8), 25)
+    await db.reset_all_data(guilds[0])
+    await db.add_member_requests(guilds[0], 10, ["AAPL"], "alice")
+    await db.drop_closed_partitions(datetime.now(timezone.utc) - timedelta(days=1))
+
+
+INDEX_SCANS = ("Index Scan", "Index Only Scan", "Bitmap Index Scan")
+
+
+def _full_scans(plan, partial_indexes):
+    # With sequential scans disabled the planner falls back to walking a whole index
+    # instead, so an index scan with no condition (on a non-partial index) counts too.
+    node_type = plan.get("Node Type")
+    if node_type == "Seq Scan":
+        yield plan["Relation Name"]
+    elif node_type in INDEX_SCANS and "Index Cond" not in plan and plan["Index Name"] not in partial_indexes:
+        yield plan.get("Relation Name", plan["Index Name"])
+    for child in plan.get("Plans", ()):
+        yield from _full_scans(child, partial_indexes)
+
+
+async def check_plans(host, database, user, password):
+    """Returns (query, relation) for every recorded query that still plans a full scan.
+
+    The tables are tiny, so sequential scans are disabled first: the planner only falls
+    back to one when no index can serve the query at all.
+    """
+    recorded = {}
+    recording = False
+
+    def record(logged):
+        if recording and logged.exception is None:
+            recorded.setdefault(logged.query, logged.args)
+
+    async def init(conn):
+        conn.add_query_logger(record)
+
+    db = Database(host, database, user, password, min_size=1, max_size=2)
+    db.pool_params["init"] = init
+    await db.connect()
+    try:
+        await db.migrate()
+        recording = True
+        await exercise(db)
+        recording = False
+
+        offenders = []
+        async with db.pool.acquire() as conn:
+            partial_indexes = {
+                name for name, in await conn.fetch(
+                    "SELECT indexrelid::regclass::text FROM pg_index WHERE indpred IS NOT NULL"
+                )
+            }
+            await conn.execute("SET enable_seqscan = off")
+            for query, args in recorded.items():
+                if not query.lstrip().upper().startswith(PLANNED_STATEMENTS) or "pg_advisory" in query:
+                    continue
+                plan = json.loads(await conn.fetchval(f"EXPLAIN (FORMAT JSON) {query}", *args))[0]["Plan"]
+                for relation in _full_scans(plan, partial_indexes):
+                    if not relation.startswith("pg_"):
+                        offenders.append((" ".join(query.split()), relation))
+        return offenders, len(recorded)
+    finally:
+        await db.close()
+
+
+@contextlib.asynccontextmanager
+async def scratch_database(prefix):
+    """Creates a throwaway database next to the configured one, never touching the bot's own.
+
+    Yields the connection settings for it, and drops it again on exit.
+    """
+    host = os.getenv("DB_HOST")
+    user = os.getenv("DB_USER")
+    password = os.getenv("DB_PASSWORD")
+    scratch = f"{prefix}_{os.getpid()}"
+
+    admin = await asyncpg.connect(host=host, database=os.getenv("DB_NAME"), user=user, password=password)
+    await admin.execute(f'CREATE DATABASE "{scratch}"')
+    try:
+        yield host, scratch, user, password
+    finally:
+        await admin.execute(f'DROP DATABASE "{scratch}" WITH (FORCE)')
+        await admin.close()
+
+
+async def main():
+    async with scratch_database("reqvest_plans") as settings:
+        offenders, checked = await check_plans(*settings)
+
+    for query, relation in offenders:
+        print(f"Full scan of {relation}: {query}")
+    print(f"Checked {checked} queries, {len(offenders)} full scans")
+    return 1 if offenders else 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
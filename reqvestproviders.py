@@ -0,0 +1,234 @@
+import aiohttp
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from finnhubapi import search_finnhub, parse_finnhub
+from twelvedataapi import search_twelve_data, parse_twelve_data
+from yahooapi import search_yahoo, parse_yahoo
+
+logger = logging.getLogger('reqvest_providers')
+
+PROVIDERS = {
+    "finnhub": (search_finnhub, parse_finnhub),
+    "twelvedata": (search_twelve_data, parse_twelve_data),
+    "yahoo": (search_yahoo, parse_yahoo),
+}
+
+
+class CircuitBreaker:
+    """Stops calling a provider after repeated failures, retrying once `reset_after` has passed."""
+
+    def __init__(self, threshold=3, reset_after=60):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+
+    def allow(self):
+        if self.opened_at is None:
+            return True
+        if time.monotonic() - self.opened_at >= self.reset_after:
+            # Half-open: let one trial through; another failure re-opens the breaker.
+            self.opened_at = time.monotonic()
+            return True
+        return False
+
+    def succeeded(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def failed(self):
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+
+class ProviderCache:
+    """SQLite-backed cache of normalized provider results, warm-loaded into memory.
+
+    Empty results are cached too (negative entries) with their own, shorter TTL, and the
+    least recently used entries are evicted once max_entries is exceeded.
+    """
+
+    def __init__(self, path, ttls=None, default_ttl=7 * 86400, negative_ttl=86400, max_entries=50000):
+        self.ttls = ttls or {}
+        self.default_ttl = default_ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.entries = {}
+
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS provider_cache (
+                provider TEXT,
+                query TEXT,
+                results TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                used_at REAL NOT NULL,
+                PRIMARY KEY (provider, query)
+            )
+        """)
+        self._warm()
+
+    def _ttl(self, provider, results):
+        return self.ttls.get(provider, self.default_ttl) if results else self.negative_ttl
+
+    def _warm(self):
+        now = time.time()
+        expired = []
+        for provider, query, results, fetched_at, used_at in self.conn.execute(
+            "SELECT provider, query, results, fetched_at, used_at FROM provider_cache"
+        ):
+            results = [tuple(result) for result in json.loads(results)]
+            if now - fetched_at > self._ttl(provider, results):
+                expired.append((provider, query))
+            else:
+                self.entries[(provider, query)] = [results, fetched_at, used_at]
+
+        with self.conn:
+            self.conn.executemany("DELETE FROM provider_cache WHERE provider = ? AND query = ?", expired)
+
+    def get(self, provider, query):
+        """Returns cached results ([] for a negative entry), or None when nothing usable is cached."""
+        entry = self.entries.get((provider, query))
+        if entry is None:
+            return None
+
+        results, fetched_at, _ = entry
+        now = time.time()
+        if now - fetched_at > self._ttl(provider, results):
+            del self.entries[(provider, query)]
+            with self.conn:
+                self.conn.execute("DELETE FROM provider_cache WHERE provider = ? AND query = ?", (provider, query))
+            return None
+
+        # Recency only lives in memory between evictions, so hits never touch the disk.
+        entry[2] = now
+        return results
+
+    def put(self, provider, query, results):
+        now = time.time()
+        self.entries[(provider, query)] = [results, now, now]
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO provider_cache VALUES (?, ?, ?, ?, ?)",
+                (provider, query, json.dumps(results), now, now)
+            )
+
+        if len(self.entries) > self.max_entries:
+            self._evict(len(self.entries) - self.max_entries + self.max_entries // 10)
+
+    def _evict(self, count):
+        oldest = sorted(self.entries, key=lambda key: self.entries[key][2])[:count]
+        for key in oldest:
+            del self.entries[key]
+        with self.conn:
+            self.conn.executemany("DELETE FROM provider_cache WHERE provider = ? AND query = ?", oldest)
+
+    def close(self):
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE provider_cache SET used_at = ? WHERE provider = ? AND query = ?",
+                [(used_at, provider, query) for (provider, query), (_, _, used_at) in self.entries.items()]
+            )
+        self.conn.close()
+
+
+class SymbolProviders:
+    """External symbol search over one pooled session, hedging providers so the first
+    usable answer wins."""
+
+    def __init__(self, names, timeout=2.0, hedge_delay=0.3, cache=None):
+        self.names = [name for name in names if name in PROVIDERS]
+        self.timeout = timeout
+        self.hedge_delay = hedge_delay
+        self.cache = cache
+        self.breakers = {name: CircuitBreaker() for name in self.names}
+        self.session = None
+
+    async def start(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=20, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=self.timeout)
+        )
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+        if self.cache:
+            self.cache.close()
+
+    async def search(self, name, query):
+        """Returns normalized (SYMBOL, company name) pairs from one provider, or None on failure."""
+        query = " ".join(query.upper().split())
+        if self.cache:
+            cached = self.cache.get(name, query)
+            if cached is not None:
+                return cached
+
+        search, parse = PROVIDERS[name]
+        breaker = self.breakers[name]
+        try:
+            data = await asyncio.wait_for(search(query, self.session), self.timeout)
+        except Exception as e:
+            logger.warning("%s lookup failed for %r: %r", name, query, e)
+            data = None
+
+        if data is None:
+            breaker.failed()
+            return None
+
+        breaker.succeeded()
+        results = [(symbol.upper(), company) for symbol, company in parse(data) if symbol]
+        if self.cache:
+            self.cache.put(name, query, results)
+        return results
+
+    async def _accepted(self, name, query, accept):
+        results = await self.search(name, query)
+        for symbol, company in results or ():
+            # Yahoo and the SEC list use BRK-B where Polygon uses BRK.B.
+            for candidate in (symbol, symbol.replace("-", ".")):
+                if accept(candidate):
+                    return candidate, company
+        return None
+
+    async def lookup(self, query, accept=lambda symbol: True):
+        """Hedged lookup: the next provider starts whenever the previous ones have not
+        answered within hedge_delay. Returns (symbol, company name) or None.
+
+        The first answer that `accept` admits wins as is; it is not cross-checked against
+        the other providers, so `accept` (the local universe, in the bot) is the only guard
+        against a provider returning the wrong listing. Waiting for agreement would cost
+        the slowest provider's latency on every miss.
+        """
+        pending = set()
+        try:
+            for name in self.names:
+                if not self.breakers[name].allow():
+                    continue
+                pending.add(asyncio.create_task(self._accepted(name, query, accept)))
+                result = await self._first_result(pending, self.hedge_delay)
+                if result:
+                    return result
+            return await self._first_result(pending, None)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _first_result(self, pending, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while pending:
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            done, _ = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                return None
+            for task in done:
+                pending.discard(task)
+                if task.result():
+                    return task.result()
+        return None
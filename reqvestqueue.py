@@ -0,0 +1,172 @@
+import asyncio
+import json
+import logging
+import os
+
+logger = logging.getLogger('reqvest_queue')
+
+class VoteQueue:
+    """Write-behind front for Database: votes are journaled locally and flushed in batches.
+
+    A vote is acknowledged once its journal line is fsynced, so it survives a host crash as
+    well as a process crash; votes arriving together share one fsync.
+
+    Every other Database method is passed straight through, so the bot can use a
+    VoteQueue wherever it would use the Database itself.
+    """
+
+    def __init__(self, db, journal_path, flush_interval=2.0, max_batch=500):
+        self.db = db
+        self.journal_path = journal_path
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.pending = []
+        self._journal = None
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        self._sync = None
+
+    def __getattr__(self, name):
+        return getattr(self.db, name)
+
+    async def start(self):
+        self.pending = self._replay()
+        self._rewrite_journal()
+        if self.pending:
+            logger.info("Replaying %d unflushed votes from %s", len(self.pending), self.journal_path)
+            self._wake.set()
+        self._task = asyncio.create_task(self._flush_loop())
+
+    def _replay(self):
+        if not os.path.exists(self.journal_path):
+            return []
+
+        votes = []
+        with open(self.journal_path, "r") as f:
+            for line in f:
+                try:
+                    votes.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A torn final line from a crash mid-write; everything before it is intact.
+                    break
+        return votes
+
+    def _rewrite_journal(self):
+        if self._journal:
+            self._journal.close()
+
+        tmp_path = f"{self.journal_path}.tmp"
+        with open(tmp_path, "w") as f:
+            for vote in self.pending:
+                f.write(json.dumps(vote) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.journal_path)
+
+        self._journal = open(self.journal_path, "a")
+
+    async def _fsync_journal(self):
+        # Group commit: every vote journaled before this runs shares one fsync, off the loop.
+        await asyncio.sleep(0)
+        self._sync = None
+        journal = self._journal
+        try:
+            await asyncio.to_thread(os.fsync, journal.fileno())
+        except (OSError, ValueError):
+            # A rewrite replaced the journal meanwhile; it fsyncs every pending vote itself.
+            if journal is self._journal:
+                raise
+
+    async def add_member_requests(self, guild_id, discord_id, tickers, member_name):
+        """Journals the vote and returns once it is on disk; duplicates are only resolved at flush time."""
+        tickers = list(dict.fromkeys(ticker.upper() for ticker in tickers))
+        vote = {
+            "guild_id": guild_id,
+            "discord_id": discord_id,
+            "member_name": member_name,
+            "tickers": tickers
+        }
+
+        self._journal.write(json.dumps(vote) + "\n")
+        self._journal.flush()
+        self.pending.append(vote)
+
+        if tickers:
+            self.db.mark_voted(guild_id, discord_id)
+        if len(self.pending) >= self.max_batch:
+            self._wake.set()
+
+        if self._sync is None:
+            self._sync = asyncio.ensure_future(self._fsync_journal())
+        await asyncio.shield(self._sync)
+        return tickers, []
+
+    async def flush(self):
+        async with self._flush_lock:
+            while self.pending:
+                batch = self.pending[:self.max_batch]
+                await self.db.add_votes([
+                    (vote["guild_id"], vote["discord_id"], vote["member_name"], vote["tickers"])
+                    for vote in batch
+                ])
+                del self.pending[:len(batch)]
+                self._rewrite_journal()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("DB Error flushing vote queue (%d pending): %s", len(self.pending), e)
+                await asyncio.sleep(self.flush_interval)
+
+    async def requests_count(self, guild_id, limit=None, offset=0):
+        await self.flush()
+        return await self.db.requests_count(guild_id, limit, offset)
+
+    async def requests_history(self, guild_id, since, limit=None):
+        await self.flush()
+        return await self.db.requests_history(guild_id, since, limit)
+
+    async def reset_all_data(self, guild_id):
+        # The guild's queued votes belong to the cycle being closed, so they are written into it
+        # first. They leave the journal only once the cycle is closed; if either step fails they
+        # stay queued, and re-flushing votes that already landed is a no-op. Holding the flush
+        # lock keeps the flush loop from racing this.
+        async with self._flush_lock:
+            queued = [vote for vote in self.pending if vote["guild_id"] == guild_id]
+            for start in range(0, len(queued), self.max_batch):
+                await self.db.add_votes([
+                    (vote["guild_id"], vote["discord_id"], vote["member_name"], vote["tickers"])
+                    for vote in queued[start:start + self.max_batch]
+                ])
+            await self.db.reset_all_data(guild_id)
+
+            # Votes that arrived while this ran were not written, and belong to the new cycle.
+            written = {id(vote) for vote in queued}
+            self.pending = [vote for vote in self.pending if id(vote) not in written]
+            self._rewrite_journal()
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error("DB Error flushing vote queue on close, %d votes left in journal: %s", len(self.pending), e)
+
+        if self._journal:
+            self._journal.close()
+        await self.db.close()
@@ -0,0 +1,281 @@
+import asyncio
+import logging
+import multiprocessing
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from reqvestcompact import CompactCompanyIndex
+from reqvestindex import POPULAR_TIER, TieredIndex
+from reqvestlogging import setup_worker_logging
+from reqvestmetrics import RESOLVE_OUTCOMES, RESOLVE_SECONDS
+
+logger = logging.getLogger('reqvest_resolver')
+
+
+def normalize_request(request):
+    return " ".join(request.upper().split())
+
+
+def _tickers_outcome(index, name, tickers):
+    if len(tickers) == 1:
+        return ("confirmed", tickers[0])
+    return ("awaiting", name, index.ranked(tickers))
+
+
+def exact_outcome(index, request):
+    if request in index.ticker_to_company:
+        return ("confirmed", request)
+    tickers = index.company_to_ticker.get(request)
+    if tickers is None:
+        tickers = index.aliases.get(request)
+    if tickers is None:
+        return None
+    return _tickers_outcome(index, request, tickers)
+
+
+def fuzzy_outcomes(index, requests):
+    outcomes = {}
+    for request, (match, score) in zip(requests, index.best_matches(requests)):
+        if score > 80:
+            outcomes[request] = _tickers_outcome(index, match, index.company_to_ticker[match])
+        else:
+            outcomes[request] = ("no_match",)
+    return outcomes
+
+
+def collect_outcomes(requests, outcomes):
+    confirmed = []
+    awaiting = {}
+    no_matches = []
+
+    for request in requests:
+        outcome = outcomes[request]
+        if outcome[0] == "confirmed":
+            confirmed.append(outcome[1])
+        elif outcome[0] == "awaiting":
+            awaiting[outcome[1]] = outcome[2]
+        else:
+            no_matches.append(request)
+
+    return confirmed, awaiting, no_matches
+
+
+def process_requests(index, requests):
+    outcomes = {}
+    misses = []
+    for request in dict.fromkeys(requests):
+        outcome = exact_outcome(index, request)
+        if outcome is None:
+            misses.append(request)
+        else:
+            outcomes[request] = outcome
+
+    outcomes.update(fuzzy_outcomes(index, misses))
+    return collect_outcomes(requests, outcomes)
+
+
+class ResolutionCache:
+    """Bounded LRU of fuzzy resolution outcomes keyed by normalized request, with optional TTL."""
+
+    def __init__(self, maxsize=10000, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, request):
+        entry = self.entries.get(request)
+        if entry is not None:
+            outcome, expires_at = entry
+            if expires_at is None or expires_at > time.monotonic():
+                self.entries.move_to_end(request)
+                self.hits += 1
+                return outcome
+            del self.entries[request]
+
+        self.misses += 1
+        return None
+
+    def put(self, request, outcome):
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        self.entries[request] = (outcome, expires_at)
+        self.entries.move_to_end(request)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        return {"size": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+_worker_index = None
+_worker_args = None
+_worker_generation = 0
+
+def _init_worker(filepath, popularity_path, popular_size):
+    global _worker_args
+    setup_worker_logging()
+    _worker_args = (filepath, popularity_path, popular_size)
+    _load_worker_index(0)
+
+
+def _load_worker_index(generation):
+    # Workers map the same compact file, so its pages are shared rather than copied per process.
+    global _worker_index, _worker_generation
+    filepath, popularity_path, popular_size = _worker_args
+    index = CompactCompanyIndex.from_file(filepath)
+    if popularity_path:
+        index = TieredIndex.from_file(index, popularity_path, popular_size)
+    _worker_index, _worker_generation = index, generation
+
+
+def _resolve_in_worker(requests, generation):
+    if generation != _worker_generation:
+        # The universe was reloaded since this worker last resolved; attach the new compact file.
+        _load_worker_index(generation)
+    return fuzzy_outcomes(_worker_index, requests)
+
+
+def _pool_context():
+    # fork stops workers from re-running the bot's entry script; spawn is the fallback elsewhere.
+    # Workers are only ever forked at startup, while the process is still single-threaded (the
+    # bot starts its log listener after the Resolver); reloads reuse them.
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context("spawn")
+
+
+class Resolver:
+    """Resolves requests through a memo cache, running fuzzy matching in worker processes,
+    threads, or inline."""
+
+    def __init__(self, index, filepath, workers=0, mode="process", cache_size=10000, cache_ttl=None,
+                 popularity_path=None, popular_size=POPULAR_TIER):
+        self.index = index
+        self.filepath = filepath
+        # Worker processes build their own TieredIndex from the same ranked list.
+        self.popularity_path = popularity_path
+        self.popular_size = popular_size
+        self.workers = workers
+        self.mode = mode
+        self.cache = ResolutionCache(cache_size, cache_ttl)
+        self.providers = None
+        self.pool = None
+        self.generation = 0
+
+        if workers > 0:
+            self._start_pool(workers)
+
+    def _start_pool(self, workers):
+        try:
+            if self.mode == "thread":
+                self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="resolver")
+            else:
+                # Write the compact file once up front instead of racing every worker to it.
+                CompactCompanyIndex.from_file(self.filepath)
+                self.pool = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=_pool_context(),
+                    initializer=_init_worker,
+                    initargs=(self.filepath, self.popularity_path, self.popular_size)
+                )
+                # Launch the workers now, before the log listener or any other thread starts.
+                self.pool.submit(int).result()
+        except (OSError, BrokenProcessPool) as e:
+            logger.warning("Could not start resolver pool, resolving inline: %s", e)
+            self.pool = None
+
+    async def set_index(self, index):
+        """Swaps in a reloaded universe without blocking the event loop.
+
+        Process workers keep running: the compact file is rewritten off-loop, and each
+        worker re-attaches it the next time it sees the bumped generation.
+        """
+        if self.pool and self.mode != "thread":
+            try:
+                await asyncio.to_thread(CompactCompanyIndex.from_file, self.filepath)
+            except OSError as e:
+                logger.warning("Could not rebuild the compact index, resolving inline: %s", e)
+                self.close()
+
+        # Cached outcomes describe the old universe.
+        self.index = index
+        self.generation += 1
+        self.cache.clear()
+
+    async def resolve(self, requests):
+        requests = [normalize_request(request) for request in requests]
+        index = self.index
+
+        outcomes = {}
+        misses = []
+        with RESOLVE_SECONDS.time(stage="exact"):
+            for request in dict.fromkeys(requests):
+                outcome = exact_outcome(index, request)
+                if outcome is not None:
+                    RESOLVE_OUTCOMES.inc(path="exact")
+                else:
+                    outcome = self.cache.get(request)
+                    if outcome is not None:
+                        RESOLVE_OUTCOMES.inc(path="cached")
+
+                if outcome is None:
+                    misses.append(request)
+                else:
+                    outcomes[request] = outcome
+
+        if misses:
+            with RESOLVE_SECONDS.time(stage="fuzzy"):
+                fuzzy = await self._fuzzy_outcomes(misses)
+            RESOLVE_OUTCOMES.inc(sum(outcome[0] != "no_match" for outcome in fuzzy.values()), path="fuzzy")
+            if self.providers:
+                with RESOLVE_SECONDS.time(stage="provider"):
+                    await self._provider_outcomes(index, fuzzy)
+            RESOLVE_OUTCOMES.inc(sum(outcome[0] == "no_match" for outcome in fuzzy.values()), path="no_match")
+            if self.index is index:
+                for request, outcome in fuzzy.items():
+                    # With providers attached, misses are left to their own caching so
+                    # a provider outage is not remembered as a permanent no-match.
+                    if outcome[0] != "no_match" or not self.providers:
+                        self.cache.put(request, outcome)
+            outcomes.update(fuzzy)
+
+        return collect_outcomes(requests, outcomes)
+
+    async def _provider_outcomes(self, index, outcomes):
+        # Only symbols that exist in the local universe are accepted, so external aliases
+        # still resolve to the same standardized tickers.
+        unmatched = [request for request, outcome in outcomes.items() if outcome[0] == "no_match"]
+        results = await asyncio.gather(*(
+            self.providers.lookup(request, accept=index.ticker_to_company.__contains__)
+            for request in unmatched
+        ))
+        for request, result in zip(unmatched, results):
+            if result:
+                RESOLVE_OUTCOMES.inc(path="provider")
+                outcomes[request] = ("confirmed", result[0])
+
+    async def _fuzzy_outcomes(self, requests):
+        if self.pool is None:
+            return fuzzy_outcomes(self.index, requests)
+
+        loop = asyncio.get_running_loop()
+        try:
+            if self.mode == "thread":
+                return await loop.run_in_executor(self.pool, fuzzy_outcomes, self.index, requests)
+            return await loop.run_in_executor(self.pool, _resolve_in_worker, requests, self.generation)
+        except BrokenProcessPool as e:
+            logger.error("Resolver pool failed, falling back to inline resolution: %s", e)
+            self.close()
+            return fuzzy_outcomes(self.index, requests)
+
+    def close(self):
+        if self.pool:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
@@ -0,0 +1,86 @@
+import time
+from collections import OrderedDict
+
+
+class DisambiguationSession:
+    __slots__ = ("user_id", "awaiting", "confirmed", "current_request", "view", "last_active")
+
+    def __init__(self, user_id, awaiting, confirmed):
+        self.user_id = user_id
+        self.awaiting = awaiting
+        self.confirmed = confirmed
+        self.current_request = next(iter(awaiting))
+        self.view = None
+        self.last_active = time.monotonic()
+
+
+class SessionStore:
+    """Per-user "Multiple tickers found" sessions with a hard size cap and idle expiry.
+
+    Sessions are kept in least-recently-active order; expiring, evicting or replacing a
+    session also stops its View so discord.py releases it.
+    """
+
+    def __init__(self, max_sessions=1000, idle_ttl=600):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.sessions = OrderedDict()
+        self.expired = 0
+        self.completed = 0
+        self.replaced = 0
+
+    def start(self, user_id, awaiting, confirmed):
+        self.sweep()
+
+        previous = self.sessions.pop(user_id, None)
+        if previous is not None:
+            self._stop(previous)
+            self.replaced += 1
+
+        while len(self.sessions) >= self.max_sessions:
+            _, oldest = self.sessions.popitem(last=False)
+            self._stop(oldest)
+            self.expired += 1
+
+        session = DisambiguationSession(user_id, awaiting, confirmed)
+        self.sessions[user_id] = session
+        return session
+
+    def is_current(self, session):
+        return self.sessions.get(session.user_id) is session
+
+    def touch(self, session):
+        session.last_active = time.monotonic()
+        self.sessions.move_to_end(session.user_id)
+
+    def complete(self, session):
+        if self.is_current(session):
+            del self.sessions[session.user_id]
+            self.completed += 1
+
+    def expire(self, session):
+        if self.is_current(session):
+            del self.sessions[session.user_id]
+            self._stop(session)
+            self.expired += 1
+
+    def sweep(self):
+        cutoff = time.monotonic() - self.idle_ttl
+        while self.sessions:
+            session = next(iter(self.sessions.values()))
+            if session.last_active > cutoff:
+                break
+            self.expire(session)
+
+    def _stop(self, session):
+        if session.view is not None:
+            session.view.stop()
+            session.view = None
+
+    def stats(self):
+        return {
+            "active": len(self.sessions),
+            "expired": self.expired,
+            "completed": self.completed,
+            "replaced": self.replaced
+        }
@@ -0,0 +1,147 @@
+import aiohttp
+import asyncio
+import os
+import signal
+import sys
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+GATEWAY_URL = os.getenv("DISCORD_API_URL", "https://discord.com/api/v10") + "/gateway/bot"
+BOT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reqvest.py")
+RESTART_DELAY = 5
+# Discord allows one IDENTIFY per 5 seconds per rate-limit bucket.
+IDENTIFY_INTERVAL = 5
+MAX_RESTART_DELAY = 300
+
+
+def parse_shard_ids(spec):
+    """Parses a shard list such as "0-3,6" into sorted ids; an empty spec means None."""
+    shard_ids = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start, _, end = part.partition("-")
+        shard_ids.update(range(int(start), int(end or start) + 1))
+    return sorted(shard_ids) or None
+
+
+def format_shard_ids(shard_ids):
+    return ",".join(str(shard_id) for shard_id in shard_ids)
+
+
+def shard_for_guild(guild_id, shard_count):
+    # Discord's own routing rule for which shard receives a guild's events.
+    return (guild_id >> 22) % shard_count
+
+
+def shard_filter_sql(column, shard_count, shard_ids):
+    """shard_for_guild as a SQL condition: `column` routes to one of the `shard_ids` shards.
+
+    shard_count and shard_ids are the placeholders that carry the count and id array.
+    """
+    return f"({column} >> 22) % {shard_count} = ANY({shard_ids}::bigint[])"
+
+
+def plan_processes(shard_count, processes):
+    """Splits shards 0..shard_count-1 into `processes` contiguous, near-equal ranges."""
+    processes = max(1, min(processes, shard_count))
+    size, extra = divmod(shard_count, processes)
+    plan = []
+    start = 0
+    for i in range(processes):
+        end = start + size + (1 if i < extra else 0)
+        plan.append(list(range(start, end)))
+        start = end
+    return plan
+
+
+async def recommended_shard_count(token):
+    headers = {"Authorization": f"Bot {token}"}
+    async with aiohttp.ClientSession(headers=headers) as session:
+        async with session.get(GATEWAY_URL) as response:
+            response.raise_for_status()
+            data = await response.json()
+    return data["shards"]
+
+
+class ShardProcess:
+    """One bot process owning a fixed range of shards, restarted with backoff if it dies."""
+
+    def __init__(self, shard_ids, shard_count):
+        self.shard_ids = shard_ids
+        self.shard_count = shard_count
+        self.process = None
+        self.delay = RESTART_DELAY
+
+    async def start(self):
+        env = dict(os.environ)
+        env["SHARD_COUNT"] = str(self.shard_count)
+        env["SHARD_IDS"] = format_shard_ids(self.shard_ids)
+        # Every process on the host maps the same compact index instead of building its own.
+        env.setdefault("INDEX_COMPACT", "1")
+        self.process = await asyncio.create_subprocess_exec(sys.executable, BOT_SCRIPT, env=env)
+        print(f"Started shards {env['SHARD_IDS']} as pid {self.process.pid}")
+
+    async def supervise(self, stopping, initial_delay=0):
+        try:
+            await asyncio.wait_for(stopping.wait(), initial_delay)
+            return
+        except asyncio.TimeoutError:
+            pass
+
+        while not stopping.is_set():
+            await self.start()
+            started = time.monotonic()
+            code = await self.process.wait()
+            if stopping.is_set():
+                break
+
+            # A process that stayed up for a while gets restarted promptly again next time.
+            if time.monotonic() - started > MAX_RESTART_DELAY:
+                self.delay = RESTART_DELAY
+            print(f"Shards {format_shard_ids(self.shard_ids)} exited with {code}; restarting in {self.delay}s")
+            try:
+                await asyncio.wait_for(stopping.wait(), self.delay)
+            except asyncio.TimeoutError:
+                pass
+            self.delay = min(self.delay * 2, MAX_RESTART_DELAY)
+
+    def terminate(self):
+        if self.process and self.process.returncode is None:
+            self.process.terminate()
+
+
+async def main():
+    shard_count = int(os.getenv("SHARD_COUNT", "0"))
+    if shard_count <= 0:
+        shard_count = await recommended_shard_count(os.getenv("DISCORD_TOKEN"))
+    processes = int(os.getenv("SHARD_PROCESSES", str(os.cpu_count() or 1)))
+
+    plan = plan_processes(shard_count, processes)
+    print(f"Launching {shard_count} shards across {len(plan)} processes")
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    shards = []
+    supervisors = []
+    delay = 0
+    for shard_ids in plan:
+        shard = ShardProcess(shard_ids, shard_count)
+        shards.append(shard)
+        # Stagger launches so processes are not all identifying their shards at once.
+        supervisors.append(asyncio.create_task(shard.supervise(stopping, delay)))
+        delay += IDENTIFY_INTERVAL * len(shard_ids)
+    await stopping.wait()
+
+    for shard in shards:
+        shard.terminate()
+    await asyncio.gather(*supervisors)
+
+if __name__ == "__main__":
+    asyncio.run(main())
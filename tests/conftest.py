@@ -0,0 +1,45 @@
+import contextlib
+import json
+import os
+import sys
+
+import pytest
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+requires_database = pytest.mark.skipif(not os.getenv("DB_HOST"), reason="DB_HOST is not set")
+
+
+@pytest.fixture(scope="session")
+def universe_path(tmp_path_factory):
+    """The committed ranked list, converted to the Polygon shape build_company_data reads."""
+    with open(os.path.join(ROOT, "tickers_cleaned.json"), "r") as f:
+        ranked = json.load(f)
+    path = tmp_path_factory.mktemp("universe") / "tickers.json"
+    path.write_text(json.dumps([
+        {"ticker": entry["symbol"], "name": entry["name"], "market": "stocks"} for entry in ranked
+    ]))
+    return str(path)
+
+
+@pytest.fixture(scope="session")
+def query_corpus():
+    with open(os.path.join(ROOT, "bench_queries.json"), "r") as f:
+        return json.load(f)
+
+
+@contextlib.asynccontextmanager
+async def stub_server(app):
+    """Serves an aiohttp app on an ephemeral local port; yields its base URL."""
+    runner = web.AppRunner(app, shutdown_timeout=0.1)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        await runner.cleanup()
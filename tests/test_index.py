@@ -0,0 +1,170 @@
+import os
+import pickle
+import random
+
+import pytest
+from rapidfuzz import process
+
+from reqvestcompact import CompactCompanyIndex
+from conftest import ROOT
+from reqvestindex import (
+    CONFIDENT_SCORE, SNAPSHOT_VERSION, CompanyIndex, TieredIndex, build_company_data, company_name_scorer,
+    company_name_scores
+)
+from reqvestresolver import exact_outcome, normalize_request
+
+MATCH_THRESHOLD = 80
+
+
+@pytest.fixture(scope="module")
+def index(universe_path):
+    return CompanyIndex(*build_company_data(universe_path))
+
+
+def regression_queries(index, corpus):
+    """The committed query corpus, typos of popular names, and short names inside a word."""
+    rng = random.Random(0)
+    queries = [normalize_request(query) for queries in corpus.values() for query in queries]
+    for name in [name for name in index.names if len(name) > 4][:60]:
+        i = rng.randrange(len(name))
+        queries.append(name[:i] + rng.choice("AEIOXZ") + name[i + 1:])
+    queries += ["STONKS", "ASDFGH", "BUY ON DIP", "WXYZBPQ"]
+    return [
+        query for query in dict.fromkeys(queries)
+        if query not in index.ticker_to_company and query not in index.company_to_ticker
+    ]
+
+
+def test_pruned_lookup_matches_full_scan(index, query_corpus):
+    # Pruning may only lower the score of queries that never matched anyway.
+    mismatches = []
+    for query in regression_queries(index, query_corpus):
+        full_match, full_score, _ = process.extractOne(query, index.names, scorer=company_name_scorer)
+        match, score = index.best_match(query)
+        if full_score > MATCH_THRESHOLD and (match, score) != (full_match, full_score):
+            mismatches.append((query, (full_match, full_score), (match, score)))
+        assert score <= MATCH_THRESHOLD or full_score > MATCH_THRESHOLD
+    assert mismatches == []
+
+
+def test_short_names_inside_a_word_are_candidates(index):
+    assert "ON" in index.candidates("STONKS")
+    assert index.best_match("STONKS")[0] == "ON"
+
+
+def test_batch_matches_single_lookups(index, query_corpus):
+    queries = regression_queries(index, query_corpus)
+    assert [match for match, _ in index.best_matches(queries)] == [index.best_match(query)[0] for query in queries]
+
+
+def test_staged_scoring_matches_exhaustive_blend(index, query_corpus):
+    # Pruning pairs between scorer stages must not change the winner or its score.
+    queries = regression_queries(index, query_corpus)
+    expected = []
+    for query in queries:
+        choices = index.candidates(query) or list(index.company_to_ticker)
+        scores = company_name_scores([query] * len(choices), choices)
+        best = int(scores.argmax())
+        expected.append((choices[best], float(scores[best])))
+    assert index.best_matches(queries) == expected
+
+
+def test_incremental_reload_keeps_candidates(index, universe_path):
+    removed = ["ON", index.names[10]]
+    added = ["FG", "NEW LISTING CORPORATION"]
+    company_to_ticker = {name: tickers for name, tickers in index.company_to_ticker.items() if name not in removed}
+    company_to_ticker.update({"FG": ["FGX"], "NEW LISTING CORPORATION": ["NLC"]})
+    ticker_to_company = {ticker: name for name, tickers in company_to_ticker.items() for ticker in tickers}
+
+    patched = index._with_names(company_to_ticker, ticker_to_company, removed, added)
+    rebuilt = CompanyIndex(company_to_ticker, ticker_to_company)
+    for query in ("STONKS", "ASDFGH", "NEW LISTIN", "MICROSFOT"):
+        assert patched.best_match(query) == rebuilt.best_match(query)
+
+
+def test_compact_index_matches(index, query_corpus, tmp_path):
+    index.digest = "0" * 64
+    compact = CompactCompanyIndex.from_index(index, str(tmp_path / "tickers.compact"))
+    for query in regression_queries(index, query_corpus):
+        assert compact.candidates(query) == index.candidates(query)
+    assert compact.company_to_ticker["ON"] == index.company_to_ticker["ON"]
+
+
+@pytest.mark.parametrize("payload", [
+    b"",
+    b"not a pickle",
+    pickle.dumps({"version": SNAPSHOT_VERSION, "digest": "d", "state": {}})[:-5],
+    pickle.dumps(["a", "list"]),
+    b"\x80\x04\x95\x1c\x00\x00\x00\x00\x00\x00\x00\x8c\x0creqvestindex\x94\x8c\x07Missing\x94\x93\x94.",
+], ids=["empty", "garbage", "truncated", "wrong_shape", "missing_class"])
+def test_unreadable_snapshot_falls_back_to_rebuild(tmp_path, payload):
+    path = tmp_path / "tickers.json.snapshot"
+    path.write_bytes(payload)
+    assert CompanyIndex.load_snapshot(str(path), "d") is None
+
+
+def test_snapshot_round_trip_leaves_no_temp_files(tmp_path, index):
+    path = tmp_path / "tickers.json.snapshot"
+    index.save_snapshot(str(path), "d")
+    assert [p.name for p in tmp_path.iterdir()] == [path.name]
+    assert CompanyIndex.load_snapshot(str(path), "d").names == index.names
+    assert CompanyIndex.load_snapshot(str(path), "other") is None
+
+
+@pytest.fixture(scope="module")
+def tiered(index):
+    return TieredIndex.from_file(index, os.path.join(ROOT, "tickers_cleaned.json"))
+
+
+class SpyIndex:
+    """Wraps the full index and records the queries that reach the long tail."""
+
+    def __init__(self, index):
+        self.index = index
+        self.queries = []
+
+    def __getattr__(self, name):
+        return getattr(self.index, name)
+
+    def best_matches(self, queries):
+        self.queries.extend(queries)
+        return self.index.best_matches(queries)
+
+
+def test_aliases_resolve_everyday_names(tiered):
+    assert exact_outcome(tiered, "JP MORGAN") == ("confirmed", "JPM")
+    assert exact_outcome(tiered, "TAIWAN SEMICONDUCTOR") == ("confirmed", "TSM")
+    assert exact_outcome(tiered, "GOOGLE") == ("awaiting", "GOOGLE", ["GOOGL", "GOOG"])
+    # A listed ticker wins over any alias spelling it.
+    assert exact_outcome(tiered, "COKE") == ("confirmed", "COKE")
+    assert not any(alias in tiered.ticker_to_company for alias in tiered.aliases)
+
+
+def test_confident_popular_match_skips_the_long_tail(tiered):
+    spy = SpyIndex(tiered.index)
+    spied = TieredIndex(spy, tiered.ranks, tiered.alias_source, tiered.popular_size)
+    queries = ["BERKSHIRE HATHWAY", "EXXON MOBILE", "MICROSOFT CORP"]
+
+    matches = spied.best_matches(queries)
+    assert [match for match, _ in matches] == ["BERKSHIRE HATHAWAY", "EXXON MOBIL", "MICROSOFT"]
+    assert all(score >= CONFIDENT_SCORE for _, score in matches)
+    assert spy.queries == []
+
+
+def test_names_outside_the_popular_tier_fall_back_to_the_full_index(tiered):
+    spy = SpyIndex(tiered.index)
+    spied = TieredIndex(spy, tiered.ranks, tiered.alias_source, tiered.popular_size)
+    queries = ["PUBMATIX", "ICECURE MEDICAX", "EXXON MOBILE"]
+
+    matches = spied.best_matches(queries)
+    assert [match for match, _ in matches] == ["PUBMATIC", "ICECURE MEDICAL", "EXXON MOBIL"]
+    assert "PUBMATIC" not in tiered.popular.names
+    assert spy.queries == ["PUBMATIX", "ICECURE MEDICAX"]
+
+
+def test_ranked_orders_tickers_by_popularity(tiered):
+    assert tiered.ranks["GOOGL"] < tiered.ranks["GOOG"]
+    assert tiered.ranked(["GOOG", "GOOGL"]) == ["GOOGL", "GOOG"]
+    # Unranked tickers go last, alphabetically.
+    assert tiered.ranked(["ZZZZ", "GOOG", "AAAA", "GOOGL"]) == ["GOOGL", "GOOG", "AAAA", "ZZZZ"]
+    assert exact_outcome(tiered, "ALPHABET") == ("awaiting", "ALPHABET", ["GOOGL", "GOOG"])
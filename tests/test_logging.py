@@ -0,0 +1,79 @@
+import atexit
+import logging
+
+import pytest
+
+import reqvestlogging
+from reqvestindex import CompanyIndex
+from reqvestresolver import Resolver
+
+
+@pytest.fixture
+def logging_env(monkeypatch, tmp_path):
+    """Points LOG_FILE at a temp file and restores the root logger afterwards."""
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    levels = {name: logging.getLogger(name).level for names in reqvestlogging.SUBSYSTEMS.values() for name in names}
+    log_file = tmp_path / "reqvest.log"
+    monkeypatch.setenv("LOG_FILE", str(log_file))
+    yield log_file
+
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
+
+
+def stop(listener):
+    """Flushes the queue to the handlers now, instead of at interpreter exit."""
+    listener.stop()
+    atexit.unregister(listener.stop)
+
+
+def test_invalid_levels_fall_back_with_a_warning(monkeypatch, logging_env):
+    monkeypatch.setenv("LOG_LEVEL", "verbose")
+    monkeypatch.setenv("LOG_LEVEL_DB", "debug")
+    monkeypatch.setenv("LOG_LEVEL_RESOLVER", "LOUD")
+    stop(reqvestlogging.setup_logging())
+
+    assert logging.getLogger().level == logging.INFO
+    assert logging.getLogger("reqvest_db").level == logging.DEBUG
+    assert logging.getLogger("reqvest_resolver").level == logging.INFO
+    log = logging_env.read_text()
+    assert "Unknown log level LOG_LEVEL='verbose', using INFO" in log
+    assert "Unknown log level LOG_LEVEL_RESOLVER='LOUD', using INFO" in log
+
+
+def test_numeric_levels_are_accepted(monkeypatch, logging_env):
+    monkeypatch.setenv("LOG_LEVEL", "30")
+    stop(reqvestlogging.setup_logging())
+    assert logging.getLogger().level == logging.WARNING
+
+
+def test_worker_records_reach_the_log(tmp_path, logging_env):
+    listener = reqvestlogging.setup_logging()
+    path = tmp_path / "tickers.json"
+    path.write_text('[{"ticker": "AAPL", "name": "Apple Inc.", "market": "stocks"}]')
+    resolver = Resolver(CompanyIndex.from_file(str(path)), str(path), workers=1, mode="process")
+    try:
+        assert resolver.pool is not None
+        resolver.pool.submit(logging.getLogger("reqvest_resolver").warning, "logged in a worker").result()
+    finally:
+        resolver.close()
+        stop(listener)
+
+    assert "reqvest_resolver - WARNING - logged in a worker" in logging_env.read_text()
+
+
+def test_deferred_listener_delivers_queued_records(logging_env):
+    listener = reqvestlogging.setup_logging(start=False)
+    logging.getLogger("reqvest_bot").warning("logged before the listener")
+    assert listener._thread is None
+
+    reqvestlogging.start_listener(listener)
+    stop(listener)
+    assert "reqvest_bot - WARNING - logged before the listener" in logging_env.read_text()
@@ -0,0 +1,15 @@
+import asyncio
+
+from conftest import requires_database
+from reqvestplans import check_plans, scratch_database
+
+
+@requires_database
+def test_recorded_queries_avoid_full_scans():
+    async def run():
+        async with scratch_database("reqvest_plans") as settings:
+            return await check_plans(*settings)
+
+    offenders, checked = asyncio.run(run())
+    assert checked > 0
+    assert offenders == []
@@ -0,0 +1,106 @@
+import asyncio
+import json
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+import polygonapi
+from conftest import stub_server
+
+
+def ticker(symbol):
+    return {"ticker": symbol, "name": f"{symbol} Inc", "market": "stocks"}
+
+
+def polygon_app(log, fail_once=()):
+    """Three ticker pages; page 2 is rate limited once, and the cursors in `fail_once` error once."""
+    pages = {
+        None: [ticker("AAA"), ticker("BBB")],
+        "2": [ticker("BBB"), ticker("CCC")],
+        "3": [ticker("DDD")],
+    }
+    throttled = set()
+
+    async def tickers(request):
+        cursor = request.query.get("cursor")
+        log.append(cursor)
+        assert request.headers["Authorization"].startswith("Bearer ")
+        if cursor == "2" and cursor not in throttled:
+            throttled.add(cursor)
+            return web.Response(status=429, headers={"Retry-After": "0"})
+        if cursor in fail_once:
+            fail_once.discard(cursor)
+            return web.Response(status=500)
+
+        body = {"results": pages[cursor], "status": "OK"}
+        following = {None: "2", "2": "3"}.get(cursor)
+        if following:
+            body["next_url"] = str(request.url.with_query(cursor=following))
+        return web.json_response(body)
+
+    app = web.Application()
+    app.router.add_get("/v3/reference/tickers", tickers)
+    return app
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def fetch(monkeypatch, app, runs=1):
+    """Runs fetch_tickers `runs` times against one stub; returns the error each run raised, if any."""
+    async def run():
+        errors = []
+        async with stub_server(app) as url:
+            monkeypatch.setattr(polygonapi, "base_url", url + "/v3/reference/tickers")
+            for _ in range(runs):
+                try:
+                    await polygonapi.fetch_tickers(rate_per_minute=6000)
+                    errors.append(None)
+                except aiohttp.ClientResponseError as e:
+                    errors.append(e.status)
+        return errors
+
+    return asyncio.run(run())
+
+
+def test_fetch_backs_off_on_429_and_writes_unique_tickers(workdir, monkeypatch):
+    log = []
+    assert fetch(monkeypatch, polygon_app(log)) == [None]
+
+    assert log == [None, "2", "2", "3"]
+    assert polygonapi.load_checkpoint() == {"next_url": None, "pages": 3}
+    assert polygonapi.write_tickers() == 4
+    with open(polygonapi.OUTPUT_PATH) as f:
+        assert [entry["ticker"] for entry in json.load(f)] == ["AAA", "BBB", "CCC", "DDD"]
+    assert not (workdir / polygonapi.CHECKPOINT_PATH).exists()
+    assert not (workdir / polygonapi.PAGES_PATH).exists()
+
+
+def test_interrupted_fetch_resumes_from_checkpoint(workdir, monkeypatch):
+    log = []
+    assert fetch(monkeypatch, polygon_app(log, {"3"}), runs=2) == [500, None]
+
+    # The second run picks up at the checkpointed cursor instead of starting over.
+    assert log == [None, "2", "2", "3", "3"]
+    assert polygonapi.load_checkpoint() == {"next_url": None, "pages": 3}
+    assert polygonapi.write_tickers() == 4
+
+
+def test_token_bucket_adapts_to_throttling():
+    async def run():
+        bucket = polygonapi.TokenBucket(rate=8, capacity=1)
+        await bucket.acquire()
+        bucket.throttled()
+        assert bucket.rate == 4 and bucket.tokens == 0
+        for _ in range(10):
+            bucket.throttled(retry_after=0)
+        assert bucket.rate == bucket.min_rate == 0.5
+        for _ in range(20):
+            bucket.succeeded()
+        assert bucket.rate == bucket.max_rate
+
+    asyncio.run(run())
@@ -0,0 +1,309 @@
+import asyncio
+import sqlite3
+import time
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+import finnhubapi
+import reqvestproviders
+import twelvedataapi
+import yahooapi
+from conftest import stub_server
+from reqvestproviders import ProviderCache, SymbolProviders
+
+FINNHUB = {"result": [
+    {"symbol": "AAPL", "description": "APPLE INC", "type": "Common Stock"},
+    {"symbol": "AAPL.SW", "description": "APPLE INC", "type": "ETP"},
+    {"description": "NO SYMBOL", "type": "Common Stock"},
+]}
+TWELVE_DATA = {"data": [
+    {"symbol": "BRK.B", "instrument_name": "Berkshire Hathaway Inc", "instrument_type": "Common Stock"},
+    {"symbol": "BRKB", "instrument_name": "Berkshire Hathaway Inc", "instrument_type": "Depositary Receipt"},
+]}
+YAHOO = {"quotes": [
+    {"symbol": "MSFT", "shortname": "Microsoft Corporation", "quoteType": "EQUITY"},
+    {"symbol": "MSFT240621C00400000", "shortname": "MSFT Call", "quoteType": "OPTION"},
+]}
+
+
+def provider_app(peers):
+    """Canned payloads for every provider; a FAIL query gets a 500, a BAD one malformed JSON."""
+
+    def handler(param, payload):
+        async def handle(request):
+            peers.append(request.transport.get_extra_info("peername"))
+            query = request.query.get(param)
+            if query == "FAIL":
+                return web.Response(status=500)
+            if query == "BAD":
+                return web.Response(text="not json", content_type="application/json")
+            return web.json_response(payload)
+        return handle
+
+    async def yahoo(request):
+        if "Mozilla" not in request.headers.get("User-Agent", ""):
+            return web.Response(status=403)
+        return await handler("q", YAHOO)(request)
+
+    app = web.Application()
+    app.router.add_get("/api/v1/search", handler("q", FINNHUB))
+    app.router.add_get("/symbol_search", handler("symbol", TWELVE_DATA))
+    app.router.add_get("/v1/finance/search", yahoo)
+    return app
+
+
+def point_at(monkeypatch, url):
+    for module in (finnhubapi, twelvedataapi, yahooapi):
+        monkeypatch.setattr(module, "base_url", url)
+    monkeypatch.setattr(finnhubapi, "api_key", "test")
+    monkeypatch.setattr(twelvedataapi, "api_key", "test")
+
+
+def test_parsers_keep_common_stock_only():
+    assert finnhubapi.parse_finnhub(FINNHUB) == [("AAPL", "APPLE INC"), ("", "NO SYMBOL")]
+    assert twelvedataapi.parse_twelve_data(TWELVE_DATA) == [("BRK.B", "Berkshire Hathaway Inc")]
+    assert yahooapi.parse_yahoo(YAHOO) == [("MSFT", "Microsoft Corporation")]
+    assert finnhubapi.parse_finnhub({}) == []
+    assert twelvedataapi.parse_twelve_data({"status": "error"}) == []
+    assert yahooapi.parse_yahoo({"quotes": []}) == []
+
+
+def test_searches_share_one_pooled_connection(monkeypatch):
+    peers = []
+
+    async def run():
+        async with stub_server(provider_app(peers)) as url:
+            point_at(monkeypatch, url)
+            async with aiohttp.ClientSession() as session:
+                results = []
+                for _ in range(2):
+                    results.append(await finnhubapi.search_finnhub("APPLE", session))
+                    results.append(await twelvedataapi.search_twelve_data("BRK.B", session))
+                    results.append(await yahooapi.search_yahoo("MICROSOFT", session))
+                assert not session.closed
+                return results
+
+    results = asyncio.run(run())
+    assert results[:3] == [FINNHUB, TWELVE_DATA, YAHOO]
+    assert results[3:] == results[:3]
+    # Six sequential calls through the shared session reuse one keep-alive connection.
+    assert len(peers) == 6 and len(set(peers)) == 1
+
+
+def test_searches_without_a_session_open_their_own(monkeypatch):
+    async def run():
+        async with stub_server(provider_app([])) as url:
+            point_at(monkeypatch, url)
+            return await asyncio.gather(
+                finnhubapi.search_finnhub("APPLE"),
+                twelvedataapi.search_twelve_data("BRK.B"),
+                yahooapi.search_yahoo("MICROSOFT"),
+            )
+
+    assert asyncio.run(run()) == [FINNHUB, TWELVE_DATA, YAHOO]
+
+
+def test_failed_searches_return_none(monkeypatch):
+    async def run():
+        async with stub_server(provider_app([])) as url:
+            point_at(monkeypatch, url)
+            async with aiohttp.ClientSession() as session:
+                return [
+                    await finnhubapi.search_finnhub("FAIL", session),
+                    await twelvedataapi.search_twelve_data("FAIL", session),
+                    await yahooapi.search_yahoo("FAIL", session),
+                ]
+
+    assert asyncio.run(run()) == [None, None, None]
+
+
+def test_malformed_payload_raises(monkeypatch):
+    # SymbolProviders.search turns this into a failed lookup for the circuit breaker.
+    async def run():
+        async with stub_server(provider_app([])) as url:
+            point_at(monkeypatch, url)
+            async with aiohttp.ClientSession() as session:
+                await finnhubapi.search_finnhub("BAD", session)
+
+    try:
+        asyncio.run(run())
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("malformed JSON was accepted")
+
+
+class Clock:
+    """Stands in for the time module inside reqvestproviders."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(reqvestproviders, "time", clock)
+    return clock
+
+
+def lookup_app(log, delays, failing=()):
+    """Every provider answers APPLE with its own listing after `delays[name]` seconds."""
+
+    def handler(name, param, payload):
+        async def handle(request):
+            log.append((name, request.query.get(param)))
+            await asyncio.sleep(delays.get(name, 0))
+            if name in failing:
+                return web.Response(status=500)
+            return web.json_response(payload)
+        return handle
+
+    app = web.Application()
+    app.router.add_get("/api/v1/search", handler("finnhub", "q", {"result": [
+        {"symbol": "AAPL", "description": "APPLE INC", "type": "Common Stock"},
+    ]}))
+    app.router.add_get("/symbol_search", handler("twelvedata", "symbol", {"data": [
+        {"symbol": "APC", "instrument_name": "Apple Inc", "instrument_type": "Common Stock"},
+    ]}))
+    app.router.add_get("/v1/finance/search", handler("yahoo", "q", {"quotes": [
+        {"symbol": "AAPL.MX", "shortname": "Apple Inc", "quoteType": "EQUITY"},
+        {"symbol": "BRK-B", "shortname": "Berkshire Hathaway", "quoteType": "EQUITY"},
+    ]}))
+    return app
+
+
+def lookups(monkeypatch, app, providers, queries, accept=lambda symbol: True):
+    """Runs the lookups in order against one stub; returns (result, seconds) for each."""
+    async def run():
+        results = []
+        async with stub_server(app) as url:
+            point_at(monkeypatch, url)
+            await providers.start()
+            try:
+                for query in queries:
+                    started = time.perf_counter()
+                    result = await providers.lookup(query, accept)
+                    results.append((result, time.perf_counter() - started))
+            finally:
+                await providers.close()
+        return results
+
+    return asyncio.run(run())
+
+
+def test_lookup_hedges_past_a_slow_provider(monkeypatch):
+    log = []
+    providers = SymbolProviders(["finnhub", "twelvedata", "yahoo"], hedge_delay=0.05)
+    [(result, elapsed)] = lookups(monkeypatch, lookup_app(log, {"finnhub": 1.0}), providers, ["apple"])
+
+    assert result == ("APC", "Apple Inc")
+    assert 0.05 <= elapsed < 0.5
+    # Twelve Data answered before the next hedge, so Yahoo was never asked.
+    assert log == [("finnhub", "APPLE"), ("twelvedata", "APPLE")]
+
+
+def test_lookup_takes_the_first_accepted_answer(monkeypatch):
+    log = []
+    providers = SymbolProviders(["finnhub", "twelvedata", "yahoo"], hedge_delay=0.05)
+    [(result, _)] = lookups(
+        monkeypatch, lookup_app(log, {}), providers, ["apple"], accept={"BRK.B"}.__contains__
+    )
+
+    # Finnhub and Twelve Data answered with symbols outside the universe; Yahoo's BRK-B maps to BRK.B.
+    assert result == ("BRK.B", "Berkshire Hathaway")
+    assert [name for name, _ in log] == ["finnhub", "twelvedata", "yahoo"]
+
+
+def test_cached_answers_skip_the_network(monkeypatch, tmp_path):
+    log = []
+    cache = ProviderCache(str(tmp_path / "cache.sqlite3"))
+    providers = SymbolProviders(["finnhub"], hedge_delay=0.05, cache=cache)
+    results = lookups(monkeypatch, lookup_app(log, {}), providers, ["apple", " Apple ", "APPLE"])
+
+    assert [result for result, _ in results] == [("AAPL", "APPLE INC")] * 3
+    assert log == [("finnhub", "APPLE")]
+
+
+def test_slow_provider_times_out_as_a_failure(monkeypatch):
+    providers = SymbolProviders(["finnhub"], timeout=0.1, hedge_delay=0.05)
+    [(result, elapsed)] = lookups(monkeypatch, lookup_app([], {"finnhub": 1.0}), providers, ["apple"])
+
+    assert result is None and elapsed < 0.5
+    assert providers.breakers["finnhub"].failures == 1
+
+
+def test_breaker_opens_after_repeated_failures(monkeypatch, clock):
+    log = []
+    providers = SymbolProviders(["finnhub", "twelvedata"], hedge_delay=0.05)
+    results = lookups(
+        monkeypatch, lookup_app(log, {}, failing={"finnhub"}), providers, ["apple", "apple", "apple", "apple"]
+    )
+
+    assert [result for result, _ in results] == [("APC", "Apple Inc")] * 4
+    # Finnhub fails fast and is hedged past each time, until its third failure opens the breaker.
+    assert [name for name, _ in log] == ["finnhub", "twelvedata"] * 3 + ["twelvedata"]
+    breaker = providers.breakers["finnhub"]
+    assert not breaker.allow()
+
+    clock.now += breaker.reset_after
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.succeeded()
+    assert breaker.allow()
+
+
+def test_cache_expires_positive_and_negative_entries(tmp_path, clock):
+    cache = ProviderCache(str(tmp_path / "cache.sqlite3"), ttls={"yahoo": 50}, default_ttl=100, negative_ttl=10)
+    cache.put("finnhub", "APPLE", [("AAPL", "APPLE INC")])
+    cache.put("yahoo", "APPLE", [("AAPL", "Apple Inc")])
+    cache.put("finnhub", "STONKS", [])
+
+    assert cache.get("finnhub", "STONKS") == []
+    assert cache.get("finnhub", "MISSING") is None
+    clock.now += 20
+    assert cache.get("finnhub", "STONKS") is None
+    assert cache.get("yahoo", "APPLE") == [("AAPL", "Apple Inc")]
+    clock.now += 40
+    assert cache.get("yahoo", "APPLE") is None
+    assert cache.get("finnhub", "APPLE") == [("AAPL", "APPLE INC")]
+    cache.close()
+
+
+def test_cache_evicts_least_recently_used(tmp_path, clock):
+    cache = ProviderCache(str(tmp_path / "cache.sqlite3"), max_entries=10)
+    for i in range(10):
+        clock.now += 1
+        cache.put("finnhub", f"Q{i}", [(f"S{i}", f"Company {i}")])
+    clock.now += 1
+    cache.get("finnhub", "Q0")
+    clock.now += 1
+    cache.put("finnhub", "Q10", [])
+
+    # One over the limit evicts the overflow plus a tenth of the cache: Q1 and Q2, not the refreshed Q0.
+    assert sorted(query for _, query in cache.entries) == sorted(["Q0"] + [f"Q{i}" for i in range(3, 11)])
+    cache.close()
+
+
+def test_cache_persists_across_reopen(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = ProviderCache(path, negative_ttl=10)
+    cache.put("finnhub", "APPLE", [("AAPL", "APPLE INC")])
+    cache.put("finnhub", "STONKS", [])
+    cache.close()
+
+    clock.now += 20
+    cache = ProviderCache(path, negative_ttl=10)
+    assert cache.get("finnhub", "APPLE") == [("AAPL", "APPLE INC")]
+    assert cache.get("finnhub", "STONKS") is None
+    cache.close()
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("SELECT query FROM provider_cache").fetchall() == [("APPLE",)]
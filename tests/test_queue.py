@@ -0,0 +1,209 @@
+import asyncio
+import json
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+import pytest
+
+import reqvestqueue
+from reqvestqueue import VoteQueue
+
+
+class FakeDatabase:
+    """Records flushed batches and per-guild cycles; the first `failures` add_votes calls and
+    the first `reset_failures` reset_all_data calls raise."""
+
+    def __init__(self, failures=0, reset_failures=0):
+        self.failures = failures
+        self.reset_failures = reset_failures
+        self.batches = []
+        self.voters = defaultdict(set)
+        self.cycles = defaultdict(set)
+        self.closed_cycles = defaultdict(list)
+        self.closed = False
+
+    async def add_votes(self, votes):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("database unavailable")
+        self.batches.append(list(votes))
+        for guild_id, discord_id, _, tickers in votes:
+            self.cycles[guild_id].update((discord_id, ticker) for ticker in tickers)
+
+    def mark_voted(self, guild_id, discord_id):
+        self.voters[guild_id].add(discord_id)
+
+    async def requests_history(self, guild_id, since, limit=None):
+        tally = Counter()
+        for cycle in [self.cycles[guild_id]] + self.closed_cycles[guild_id]:
+            tally.update(ticker for _, ticker in cycle)
+        return tally.most_common(limit)
+
+    async def reset_all_data(self, guild_id):
+        if self.reset_failures:
+            self.reset_failures -= 1
+            raise ConnectionError("database unavailable")
+        self.closed_cycles[guild_id].append(self.cycles.pop(guild_id, set()))
+        self.voters.pop(guild_id, None)
+
+    async def close(self):
+        self.closed = True
+
+    def flushed(self):
+        return [vote for batch in self.batches for vote in batch]
+
+
+def vote(discord_id, *tickers, guild_id=1):
+    return {"guild_id": guild_id, "discord_id": discord_id, "member_name": f"m{discord_id}", "tickers": list(tickers)}
+
+
+def journaled(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return str(tmp_path / "vote_journal.jsonl")
+
+
+def test_start_replays_the_journal_up_to_a_torn_line(journal):
+    with open(journal, "w") as f:
+        f.write(json.dumps(vote(1, "AAPL")) + "\n")
+        f.write(json.dumps(vote(2, "MSFT", "NVDA")) + "\n")
+        f.write('{"guild_id": 1, "discord_id": 3, "memb')
+
+    async def run():
+        db = FakeDatabase()
+        queue = VoteQueue(db, journal, flush_interval=60)
+        await queue.start()
+        # The torn line is compacted away before anything else is appended.
+        assert journaled(journal) == [vote(1, "AAPL"), vote(2, "MSFT", "NVDA")]
+        await queue.flush()
+        await queue.close()
+        return db
+
+    db = asyncio.run(run())
+    assert db.flushed() == [(1, 1, "m1", ["AAPL"]), (1, 2, "m2", ["MSFT", "NVDA"])]
+    assert journaled(journal) == []
+
+
+def test_failed_flush_keeps_votes_and_retries(journal):
+    async def run():
+        db = FakeDatabase(failures=1)
+        queue = VoteQueue(db, journal, flush_interval=60)
+        await queue.start()
+        assert await queue.add_member_requests(1, 5, ["aapl", "AAPL", "tsla"], "m5") == (["AAPL", "TSLA"], [])
+        assert db.voters[1] == {5}
+
+        with pytest.raises(ConnectionError):
+            await queue.flush()
+        assert queue.pending == [vote(5, "AAPL", "TSLA")]
+        assert journaled(journal) == [vote(5, "AAPL", "TSLA")]
+
+        await queue.flush()
+        assert queue.pending == []
+        await queue.close()
+        return db
+
+    db = asyncio.run(run())
+    assert db.flushed() == [(1, 5, "m5", ["AAPL", "TSLA"])]
+
+
+def test_flush_loop_retries_after_a_failure(journal):
+    async def run():
+        db = FakeDatabase(failures=1)
+        queue = VoteQueue(db, journal, flush_interval=0.01, max_batch=1)
+        await queue.start()
+        await queue.add_member_requests(1, 5, ["AAPL"], "m5")
+        for _ in range(100):
+            if db.batches:
+                break
+            await asyncio.sleep(0.01)
+        await queue.close()
+        return db
+
+    db = asyncio.run(run())
+    assert db.flushed() == [(1, 5, "m5", ["AAPL"])]
+    assert db.closed
+
+
+def test_flush_compacts_the_journal(journal):
+    async def run():
+        db = FakeDatabase()
+        queue = VoteQueue(db, journal, flush_interval=60)
+        await queue.start()
+        for discord_id in range(5):
+            await queue.add_member_requests(1, discord_id, ["AAPL"], f"m{discord_id}")
+        assert len(journaled(journal)) == 5
+
+        queue.max_batch = 2
+        await queue.flush()
+        assert journaled(journal) == []
+        assert [len(batch) for batch in db.batches] == [2, 2, 1]
+
+        # The reopened journal keeps taking appends after compaction.
+        await queue.add_member_requests(1, 9, ["MSFT"], "m9")
+        assert journaled(journal) == [vote(9, "MSFT")]
+        await queue.close()
+
+    asyncio.run(run())
+
+
+def test_concurrent_votes_share_one_fsync(journal, monkeypatch):
+    synced = []
+    monkeypatch.setattr(reqvestqueue.os, "fsync", synced.append)
+
+    async def run():
+        queue = VoteQueue(FakeDatabase(), journal, flush_interval=60)
+        await queue.start()
+        synced.clear()
+        await asyncio.gather(*(
+            queue.add_member_requests(1, discord_id, ["AAPL"], f"m{discord_id}") for discord_id in range(10)
+        ))
+        assert len(synced) == 1
+        await queue.add_member_requests(1, 10, ["AAPL"], "m10")
+        assert len(synced) == 2
+        await queue.close()
+
+    asyncio.run(run())
+
+
+def test_reset_writes_queued_votes_into_the_closed_cycle(journal):
+    async def run():
+        db = FakeDatabase()
+        queue = VoteQueue(db, journal, flush_interval=60)
+        await queue.start()
+        await queue.add_member_requests(1, 5, ["AAPL"], "m5")
+        await queue.add_member_requests(2, 6, ["TSLA"], "m6")
+        await queue.reset_all_data(1)
+
+        assert db.closed_cycles[1] == [{(5, "AAPL")}]
+        assert queue.pending == [vote(6, "TSLA", guild_id=2)]
+        assert journaled(journal) == [vote(6, "TSLA", guild_id=2)]
+        history = await queue.requests_history(1, datetime.now(timezone.utc))
+        await queue.close()
+        return history
+
+    assert asyncio.run(run()) == [("AAPL", 1)]
+
+
+def test_failed_reset_keeps_queued_votes(journal):
+    async def run():
+        db = FakeDatabase(reset_failures=1)
+        queue = VoteQueue(db, journal, flush_interval=60)
+        await queue.start()
+        await queue.add_member_requests(1, 5, ["AAPL"], "m5")
+
+        with pytest.raises(ConnectionError):
+            await queue.reset_all_data(1)
+        assert queue.pending == [vote(5, "AAPL")]
+        assert journaled(journal) == [vote(5, "AAPL")]
+        assert db.closed_cycles[1] == []
+
+        await queue.reset_all_data(1)
+        assert db.closed_cycles[1] == [{(5, "AAPL")}]
+        assert queue.pending == [] and journaled(journal) == []
+        await queue.close()
+
+    asyncio.run(run())
@@ -0,0 +1,36 @@
+import asyncio
+import json
+
+from reqvestindex import CompanyIndex
+from reqvestresolver import Resolver
+
+
+def write_universe(path, names):
+    path.write_text(json.dumps([
+        {"ticker": ticker, "name": name, "market": "stocks"} for ticker, name in names.items()
+    ]))
+
+
+def test_process_workers_pick_up_a_reloaded_universe(tmp_path):
+    path = tmp_path / "tickers.json"
+    write_universe(path, {"AAPL": "Apple Inc.", "MSFT": "Microsoft Corporation"})
+    index = CompanyIndex.from_file(str(path))
+    resolver = Resolver(index, str(path), workers=1, mode="process")
+    pool = resolver.pool
+
+    async def run():
+        before = await resolver.resolve(["Nvidai"])
+        write_universe(path, {"AAPL": "Apple Inc.", "MSFT": "Microsoft Corporation", "NVDA": "NVIDIA Corp"})
+        reloaded, _ = index.reloaded(str(path))
+        await resolver.set_index(reloaded)
+        return before, await resolver.resolve(["Nvidai", "Microsfot"])
+
+    try:
+        assert pool is not None
+        before, after = asyncio.run(run())
+        assert before == ([], {}, ["NVIDAI"])
+        assert after == (["NVDA", "MSFT"], {}, [])
+        # The reload reused the running workers rather than forking new ones.
+        assert resolver.pool is pool
+    finally:
+        resolver.close()
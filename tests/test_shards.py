@@ -0,0 +1,52 @@
+import asyncio
+import random
+from types import SimpleNamespace
+
+import discord
+
+from conftest import requires_database
+from reqvestdb import Database
+from reqvestplans import scratch_database
+from reqvestshards import parse_shard_ids, plan_processes, shard_for_guild
+
+SHARD_COUNT = 4
+
+
+def guild_ids(count=60):
+    rng = random.Random(0)
+    return [rng.randrange(10**17, 2**63) for _ in range(count)]
+
+
+def test_shard_for_guild_matches_discord():
+    for guild_id in guild_ids():
+        guild = SimpleNamespace(id=guild_id, _state=SimpleNamespace(shard_count=SHARD_COUNT))
+        assert shard_for_guild(guild_id, SHARD_COUNT) == discord.Guild.shard_id.fget(guild)
+
+
+def test_shard_plans():
+    assert parse_shard_ids("0-2, 6,4") == [0, 1, 2, 4, 6]
+    assert parse_shard_ids("") is None
+    assert plan_processes(10, 3) == [[0, 1, 2, 3], [4, 5, 6], [7, 8, 9]]
+
+
+@requires_database
+def test_load_voters_keeps_only_the_shards_guilds():
+    guilds = guild_ids()
+    shard_ids = [1, 3]
+
+    async def run():
+        async with scratch_database("reqvest_shards") as settings:
+            db = Database(*settings, min_size=1, max_size=2)
+            await db.connect()
+            try:
+                await db.migrate()
+                await db.add_votes([(guild_id, 7, "member", ["AAPL"]) for guild_id in guilds])
+                await db.load_voters(shard_ids, SHARD_COUNT)
+                return set(db.cycles), set(db.voters)
+            finally:
+                await db.close()
+
+    cycles, voters = asyncio.run(run())
+    expected = {guild_id for guild_id in guilds if shard_for_guild(guild_id, SHARD_COUNT) in shard_ids}
+    assert expected and expected != set(guilds)
+    assert cycles == voters == expected
@@ -1,20 +1,33 @@
 import aiohttp
 import asyncio
+import logging
 from dotenv import load_dotenv
 import os
 
 load_dotenv()
 api_key = os.getenv('TWELVE_DATA_API_KEY')
+base_url = os.getenv('TWELVE_DATA_BASE_URL', "https://api.twelvedata.com")
+logger = logging.getLogger('reqvest_providers')
 
-async def search_twelve_data(query):
-    url = f"https://api.twelvedata.com/symbol_search?symbol={query}&apikey={api_key}"
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as resp:
-            if resp.status != 200:
-                print(f"Error: HTTP {resp.status}")
-                return None
-            data = await resp.json()
-            return data
+async def search_twelve_data(query, session=None):
+    if session is None:
+        async with aiohttp.ClientSession() as session:
+            return await search_twelve_data(query, session)
+
+    url = f"{base_url}/symbol_search"
+    async with session.get(url, params={"symbol": query, "apikey": api_key}) as resp:
+        if resp.status != 200:
+            logger.warning("Twelve Data search failed: HTTP %s", resp.status)
+            return None
+        data = await resp.json()
+        return data
+
+def parse_twelve_data(data):
+    return [
+        (entry.get("symbol", ""), entry.get("instrument_name", ""))
+        for entry in data.get("data", [])
+        if entry.get("instrument_type") == "Common Stock"
+    ]
 
 async def main():
     print("Twelve Data Stock Search Tester")
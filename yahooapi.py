@@ -1,15 +1,32 @@
 import aiohttp
 import asyncio
+import logging
+import os
 
-async def search_yahoo(query):
-    url = f"https://query1.finance.yahoo.com/v1/finance/search?q={query}"
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as resp:
-            if resp.status != 200:
-                print(f"Error: {resp.status}")
-                return None
-            data = await resp.json()
-            return data
+base_url = os.getenv('YAHOO_BASE_URL', "https://query1.finance.yahoo.com")
+# Yahoo rejects requests without a browser-like User-Agent.
+headers = {"User-Agent": "Mozilla/5.0"}
+logger = logging.getLogger('reqvest_providers')
+
+async def search_yahoo(query, session=None):
+    if session is None:
+        async with aiohttp.ClientSession() as session:
+            return await search_yahoo(query, session)
+
+    url = f"{base_url}/v1/finance/search"
+    async with session.get(url, params={"q": query}, headers=headers) as resp:
+        if resp.status != 200:
+            logger.warning("Yahoo search failed: HTTP %s", resp.status)
+            return None
+        data = await resp.json()
+        return data
+
+def parse_yahoo(data):
+    return [
+        (item.get("symbol", ""), item.get("shortname", ""))
+        for item in data.get("quotes", [])
+        if item.get("quoteType") == "EQUITY"
+    ]
 
 async def main():
     print("Yahoo Finance Stock Search Tester")